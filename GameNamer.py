@@ -5,14 +5,36 @@
     Original Source: https://github.com/cr08/OBS-Recording-Renamer/tree/main
     - I modified this for my own personal use.
 """
+import functools
 import os
 import os.path
+import sys
 import threading
 import time
-import urllib.request
 
 import obspython as OBS  # pylint: disable=import-error
-from steam_registry_detector import get_running_steam_game
+import frame_matcher
+from game_fusion import Candidate, Detector, GameFusion
+from game_sampler import GameSampler
+from game_timeline import GameTimeline, recording_times
+from launcher_index import LauncherIndex
+from remux_predictor import RemuxPredictor
+from idle_scheduler import IdleScheduler
+from orphan_scan import MAX_AGE, scan_orphans
+from process_rules import ProcRuleScanner, RuleMatcher, load_rules
+from rename_engine import AsyncRenameEngine, run_blocking
+from rename_job import RenameJob, make_job
+from rename_journal import DELETING, DONE, FAILED, PENDING, RUNNING, RenameJournal
+from rename_pool import PRIORITY_LOW, PRIORITY_NORMAL, RenamePool
+from steam_applist_db import AppListDB
+from twitch_client import TwitchClient
+from remux_watcher import (EVENT_DRIVEN, remove_when_released, remove_when_released_async,
+                           wait_for_remux, wait_for_remux_async)
+from steam_registry_detector import (get_registry_game, get_running_proc_process,
+                                     get_running_steam_game, lookup_any_name,
+                                     start_registry_watcher, stop_registry_watcher)
+from worker_priority import (IOPRIO_CLASS_BE, IOPRIO_CLASS_IDLE, IOPRIO_CLASS_NONE,
+                             WorkerPriority, parse_cpu_list)
 
 # import pywinctl as pwc
 
@@ -26,6 +48,32 @@ class Data:
     RenameMode = None
     WindowCount = None
     ChannelName = None
+    Predictor = RemuxPredictor()
+    Workers = 2
+    Engine = 0
+    Pool = None
+    Journal = None
+    OrphanScanDelay = 10.0
+    MaxDefer = 600.0
+    Scheduler = None
+    Priority = None
+    # The worker priority settings the pool's threads were started with.
+    PriorityKey = None
+    # Set once script_update has applied the settings for the first time.
+    Settled = threading.Event()
+    SettleTimeout = 30.0
+    AppList = None
+    Sampler = None
+    RecordingStarted = None
+    Timeline = None
+    Rules = None
+    Launchers = None
+    Fusion = None
+    FrameIndex = None
+    Twitch = None
+    # Detectors the fusion mode may ask, by name.
+    Detectors = {"registry": True, "steam_env": True, "rules": True, "launchers": True}
+    ShutdownDeadline = 2.0
 
 # def debug(message: str):
 #     """ Wrapper for print statement to reduce linting errors.
@@ -78,19 +126,120 @@ def get_foreground_window():
     """
     window_name = "TEMP"
     # window_name = "_" + pwc.getActiveWindowTitle()
+    if Data.Rules is not None:
+        # Non-Steam games and emulators, named by the process rules table.
+        window_name = Data.Rules.running_title() or window_name
+    if window_name == "TEMP" and Data.Launchers is not None:
+        # Games installed through Heroic, Lutris or Bottles.
+        window_name = Data.Launchers.running_title() or window_name
     window_name = clean_filename(window_name)
     if Data.Debug:
         print("DEBUG: Current Foreground Window: \"" + window_name + "\"")
     return window_name
 
+def steam_app_name(game_id, game_name: str=None) -> str:
+    """ Fill in a Steam game's name from the offline app list, or fall back to its id.
+
+    Args:
+        game_id (str): The Steam appid, or None.
+        game_name (str, optional): The name a detector already found.
+
+    Returns:
+        str: The name, "SteamApp<id>" if unknown, or None without an appid.
+    """
+    if game_name is None and game_id and Data.AppList is not None:
+        game_name = Data.AppList.lookup(game_id)
+    if game_name is None and game_id:
+        game_name = "SteamApp" + str(game_id)
+    return game_name
+
+def current_steam_game() -> str:
+    """ Name of the running Steam game, without logging. Used as the sampler probe.
+
+    Returns:
+        str: Steam game name, or None if no game is running.
+    """
+    return steam_app_name(*get_running_steam_game())
+
+def _registry_candidate() -> Candidate:
+    """ Fusion detector: RunningAppID from registry.vdf. Cheap, but often stale. """
+    game_id, game_name = get_registry_game()
+    if not game_id:
+        return None
+    return Candidate(steam_app_name(game_id, game_name), 0.6 if game_name else 0.3, "registry")
+
+def _steam_env_candidate() -> Candidate:
+    """ Fusion detector: a process Steam launched, from its environment. """
+    found = get_running_proc_process()
+    if found is None:
+        return None
+    pid, starttime, game_id = found
+    game_name = lookup_any_name(game_id)
+    return Candidate(steam_app_name(game_id, game_name), 0.9 if game_name else 0.5,
+                     "steam_env", (pid, starttime))
+
+def _anchor(found: tuple) -> tuple:
+    """ (pid, starttime) of a running() result, or None. """
+    return found[:2] if found is not None else None
+
+def _scanner_candidate(scanner, source: str, confidence: float) -> Candidate:
+    """ Fusion detector: the newest process a ProcRuleScanner matched. """
+    found = scanner.running() if scanner is not None else None
+    if found is None:
+        return None
+    pid, starttime, name = found
+    return Candidate(name, confidence, source, (pid, starttime))
+
+def get_fusion() -> GameFusion:
+    """ The shared detector fusion layer, created on first use. """
+    if Data.Fusion is None:
+        Data.Fusion = GameFusion([
+            Detector("registry", _registry_candidate, 0.0),
+            Detector("steam_env", _steam_env_candidate, 1.0,
+                     lambda: _anchor(get_running_proc_process())),
+            Detector("rules", lambda: _scanner_candidate(Data.Rules, "rules", 0.8), 2.0,
+                     lambda: _anchor(Data.Rules.running() if Data.Rules else None)),
+            Detector("launchers",
+                     lambda: _scanner_candidate(Data.Launchers, "launchers", 0.85), 3.0,
+                     lambda: _anchor(Data.Launchers.running() if Data.Launchers else None)),
+        ], debug=Data.Debug)
+        for name, enabled in Data.Detectors.items():
+            Data.Fusion.set_enabled(name, enabled)
+    return Data.Fusion
+
+def current_game() -> str:
+    """ Best guess from every enabled detector, without logging.
+
+    Returns:
+        str: The game name, or None if no detector found one.
+    """
+    verdict = get_fusion().detect()
+    return verdict.name if verdict is not None else None
+
+def get_detected_game() -> str:
+    """ Uses every enabled detector to work out the game that is running.
+
+    Returns:
+        str: Game name
+    """
+    game_name = clean_filename(current_game())
+    if Data.Debug:
+        print("DEBUG: Detected Game: \"" + game_name + "\"")
+    return game_name
+
+def sample_game() -> str:
+    """ Sampler probe for the rename mode in use. """
+    if Data.RenameMode == 3:
+        return current_game()
+    return current_steam_game()
+
 def get_steam_game():
     """ Uses registers to access Steam and see what game is currently running.
 
     Returns:
         str: Steam game name
     """
-    game_name = str(get_running_steam_game()[1])
-    game_name = clean_filename(game_name)
+    game_name = clean_filename(current_steam_game())
     # if "None" in game_name:
     #     game_name = "Non-Steam"
     if Data.Debug:
@@ -98,90 +247,577 @@ def get_steam_game():
 
     return game_name
 
-def get_twitch_title():
+def get_twitch_title(channel: str):
     """ Uses the Twitch API to get the title of your twitch stream
 
+    Args:
+        channel (str): The Twitch channel to look up.
+
     Returns:
         str: Twitch Title
     """
-    twitch_streamtitle = urllib.request.urlopen(
-        "https://decapi.me/twitch/title/" + str(Data.ChannelName)).read().decode("utf-8")
-    twitch_game = urllib.request.urlopen(
-        "https://decapi.me/twitch/game/" + str(Data.ChannelName)).read().decode("utf-8")
-    title = "VOD_" + Data.ChannelName + "_" + str(twitch_game) + "_" + str(twitch_streamtitle)
-    title = clean_filename(title)
+    if Data.Twitch is None:
+        Data.Twitch = TwitchClient(debug=Data.Debug)
+    twitch_streamtitle, twitch_game = Data.Twitch.fetch(channel)
+    if twitch_streamtitle is None and twitch_game is None:
+        return ""
+    parts = ["VOD", channel] + [p for p in (twitch_game, twitch_streamtitle) if p is not None]
+    title = clean_filename("_".join(parts))
     if Data.Debug:
-        print("DEBUG: Twitch Mode: Channel - " + Data.ChannelName)
-        print("DEBUG: Twitch Mode: Game - " + str(twitch_game.decode("utf-8")))
-        print("DEBUG: Twitch Mode: Stream Title - " + str(twitch_streamtitle.decode("utf-8")))
+        print("DEBUG: Twitch Mode: Channel - " + channel)
+        print("DEBUG: Twitch Mode: Game - " + str(twitch_game))
+        print("DEBUG: Twitch Mode: Stream Title - " + str(twitch_streamtitle))
         print("DEBUG: Title Addition - \"" + title + "\"")
     return title
 
-def rename() -> None:
-    """ Get most recent recording and handle the renaming process.
+def get_remux_settings() -> tuple:
+    """ Read the recording format and auto-remux option from the current OBS profile.
 
-        - First, get the name of the most recent recording and parse it.
-        - Then, wait for the remux to finish.
-        - Delete the ".mkv" file.
-        - Get the title of the desired application.
-        - Finally, rename the ".mp4" file.
+    Returns:
+        tuple: (bool auto_remux, str rec_format)
+    """
+    config = OBS.obs_frontend_get_profile_config()
+    if OBS.config_get_string(config, "Output", "Mode") == "Advanced":
+        section = "AdvOut"
+    else:
+        section = "SimpleOutput"
 
-        All of this should be done on a separate thread to not block the main process.
-        FIXME: Will this leave hanging threads if something is interrupted?
-    """
-    # Get and parse the most recent recording name.
-    path = OBS.obs_frontend_get_last_recording()
-    dirname = os.path.dirname(path)
-    raw_file = os.path.basename(path)
-    root_ext = os.path.splitext(raw_file)
-
-    # Wait for the ".mp4" file to be created. (This doesn't mean the remux is finished).
-    old_mp4 = os.path.join(dirname, root_ext[0] + ".mp4")
-    check = 500
-    while not os.path.exists(old_mp4):
-        if not check:
-            print("Error: The process hung for too long. Maybe the video was long?")
-            break
-        check -= 1
-
-        if Data.Debug and check % 100 == 0:
-            print("Waiting on remux...\tRemux: " + old_mp4 + "\tOriginal: " + path + "\n")
-
-        time.sleep(.1)
-
-    # Remove the original MKV. If a permission error occurs then the file is still being remuxxed.
-    while os.path.exists(path):
-        try:
-            os.remove(path)
-        except PermissionError:
-            print("Waiting for the remux to finish...")
-            time.sleep(.1)
+    rec_format = (OBS.config_get_string(config, section, "RecFormat2")
+                  or OBS.config_get_string(config, section, "RecFormat")
+                  or "mkv")
+    auto_remux = OBS.config_get_bool(config, "Video", "AutoRemux")
+    # Custom FFmpeg output in Advanced mode is never remuxed by OBS.
+    if section == "AdvOut" and OBS.config_get_string(config, "AdvOut", "RecType") == "FFmpeg":
+        auto_remux = False
 
-    # Generate new title.
-    title = "_"
     if Data.Debug:
-        print("DEBUG: Recording session STOPPED...")
+        print("DEBUG: Recording format - " + str(rec_format) + "\tAuto Remux - " + str(auto_remux))
+    return auto_remux, rec_format
+
+def get_scheduler() -> IdleScheduler:
+    """ The shared idle scheduler, created on first use. """
+    if Data.Scheduler is None:
+        Data.Scheduler = IdleScheduler(Data.MaxDefer, debug=Data.Debug,
+                                       initializer=worker_initializer())
+    return Data.Scheduler
+
+def defer_heavy(func, *args):
+    """ Hand expensive post-processing to the idle scheduler.
+
+    Args:
+        func (callable): The heavy task.
+        *args: Its arguments.
+    """
+    get_scheduler().defer(func, *args)
+
+def worker_initializer():
+    """ The thread initializer that applies the worker priority settings.
+
+    Returns:
+        callable: WorkerPriority.apply, or None if low-priority workers are disabled.
+    """
+    if Data.Priority is None:
+        return None
+    return Data.Priority.apply
+
+def get_replay_seconds() -> int:
+    """ Length of the replay buffer from the current OBS profile.
+
+    Returns:
+        int: Seconds of video a replay save contains.
+    """
+    config = OBS.obs_frontend_get_profile_config()
+    if OBS.config_get_string(config, "Output", "Mode") == "Advanced":
+        return OBS.config_get_int(config, "AdvOut", "RecRBTime")
+    return OBS.config_get_int(config, "SimpleOutput", "RecRBTime")
+
+def log_game_change(game: str, when: float):
+    """ Sampler callback: log what the detectors saw in the game timeline, if there is one.
+
+    Args:
+        game (str): The game now running, or None.
+        when (float): Unix time of the change.
+    """
+    if Data.Timeline is not None:
+        Data.Timeline.game_seen(game, when)
+
+def get_sampler() -> GameSampler:
+    """ The shared game sampler, created on first use. """
+    if Data.Sampler is None:
+        Data.Sampler = GameSampler(sample_game, debug=Data.Debug, on_change=log_game_change)
+    return Data.Sampler
+
+def sampled_game(replay: bool) -> str:
+    """ The game that was on screen for most of the recording or replay that just ended.
+
+    Args:
+        replay (bool): True for a replay buffer save.
+
+    Returns:
+        str: The game, or "" if the sampler saw none.
+    """
+    now = time.monotonic()
+    if replay:
+        start = now - get_replay_seconds()
+    elif Data.RecordingStarted is not None:
+        start = Data.RecordingStarted
+    else:
+        return ""
+    game = get_sampler().dominant(start, now) or ""
+    if Data.Debug and game:
+        print("DEBUG: Game on screen for most of the recording - " + game)
+    return game
+
+def update_output_state():
+    """ Tell the idle scheduler whether OBS is encoding. Must run on the OBS thread. """
+    busy = (OBS.obs_frontend_recording_active()
+            or OBS.obs_frontend_streaming_active()
+            or OBS.obs_frontend_replay_buffer_active())
+    get_scheduler().set_busy(bool(busy))
+    # Only the Steam and detector modes name recordings by game.
+    get_sampler().set_active(bool(busy) and Data.RenameMode in (0, 3))
+
+def _remux_size(job: RenameJob) -> int:
+    """ Size of the recording being remuxed, for the predictor. None if unknown. """
+    try:
+        return os.path.getsize(job.path)
+    except OSError:
+        return None
+
+def finish_remux(job: RenameJob) -> tuple:
+    """ Wait for OBS's remux (if any) to finish.
+
+    When the wait is event driven, deleting the original is heavy work that can be
+    deferred, so it is returned as a leftover instead. When polling, the delete is what
+    tells us the remux released the file, so it has to happen here.
+
+    Args:
+        job (RenameJob): The job being processed.
+
+    Returns:
+        tuple: (str file to rename, str original still to delete or None)
+    """
+    remux_path = job.remux_path
+    if not remux_path:
+        return job.path, None
+
+    size = _remux_size(job)
+    started = time.monotonic()
+    ready_at = started + Data.Predictor.sleep_hint(job.path, size)
+
+    # Wait for the remux to write and close its output.
+    if not wait_for_remux(remux_path, debug=job.debug):
+        print("Error: Remux never finished, renaming the original recording instead.")
+        return job.path, None
+
+    if EVENT_DRIVEN:
+        if size:
+            Data.Predictor.record(job.path, size, time.monotonic() - started)
+        return remux_path, job.path
+
+    # Remove the original. Only once the remux exists, otherwise it is the only copy.
+    busy = remove_when_released(job.path, ready_at=ready_at, debug=job.debug)
+    # A polled wait that never saw the file busy only gives an upper bound.
+    if size and busy:
+        Data.Predictor.record(job.path, size, time.monotonic() - started)
+    return remux_path, None
+
+async def finish_remux_async(job: RenameJob) -> tuple:
+    """ Coroutine version of finish_remux() for the asyncio engine.
+
+    Args:
+        job (RenameJob): The job being processed.
 
-    if Data.RenameMode == 0:
-        title += get_steam_game()
+    Returns:
+        tuple: (str file to rename, str original still to delete or None)
+    """
+    remux_path = job.remux_path
+    if not remux_path:
+        return job.path, None
+
+    size = _remux_size(job)
+    started = time.monotonic()
+    ready_at = started + Data.Predictor.sleep_hint(job.path, size)
+
+    if not await wait_for_remux_async(remux_path, debug=job.debug):
+        print("Error: Remux never finished, renaming the original recording instead.")
+        return job.path, None
+
+    if EVENT_DRIVEN:
+        if size:
+            await run_blocking(Data.Predictor.record, job.path, size, time.monotonic() - started)
+        return remux_path, job.path
+
+    busy = await remove_when_released_async(job.path, ready_at=ready_at, debug=job.debug)
+    if size and busy:
+        await run_blocking(Data.Predictor.record, job.path, size, time.monotonic() - started)
+    return remux_path, None
+
+def make_title(job: RenameJob) -> str:
+    """ Build the text appended to the recording name for the job's rename mode.
+
+    Args:
+        job (RenameJob): The job being processed.
+
+    Returns:
+        str: The title addition, including its leading "_". Empty if nothing applies.
+    """
+    title = "_"
+    if job.debug:
+        if job.replay:
+            print("DEBUG: Replay buffer SAVED...")
+        else:
+            print("DEBUG: Recording session STOPPED...")
 
-    elif Data.RenameMode == 1:
-        title += get_twitch_title()
+    if job.mode == 0:
+        title += clean_filename(job.game) if job.game else get_steam_game()
 
-    elif Data.RenameMode == 2:
+    elif job.mode == 1:
+        title += get_twitch_title(job.channel)
+
+    elif job.mode == 2:
         title += get_foreground_window()
 
+    elif job.mode == 3:
+        title += clean_filename(job.game) if job.game else get_detected_game()
+
     else:
         title = ""
-        if Data.Debug:
+        if job.debug:
             print("DEBUG: The Rename mode you selected has not been implemented yet.")
 
-    new_title = root_ext[0] + title + ".mp4"
-    new_mp4 = os.path.join(dirname, new_title)
+    # Nothing was detected, leave the name alone rather than adding a bare "_".
+    if title == "_":
+        title = ""
+    return title
+
+def identify_title(job: RenameJob, output: str) -> str:
+    """ Last resort when no detector named the game: recognise it from the frames.
+
+    Args:
+        job (RenameJob): The job being processed.
+        output (str): The finished recording.
+
+    Returns:
+        str: The title addition, including its leading "_". Empty if nothing matched
+            confidently.
+    """
+    if Data.FrameIndex is None or job.mode not in (0, 3):
+        return ""
+    name, confidence = Data.FrameIndex.identify(output)
+    if job.debug:
+        print("DEBUG: Frame match - " + str(name) + f" ({confidence:.2f})")
+    name = clean_filename(name)
+    return "_" + name if name else ""
+
+def identify_later(job: RenameJob, output: str):
+    """ Idle scheduler task: name an already renamed recording from its frames.
+
+    Sampling frames runs ffmpeg several times, so it is kept out of the rename worker.
+
+    Args:
+        job (RenameJob): The job that produced the recording.
+        output (str): The recording, as left by the rename.
+    """
+    if not os.path.exists(output):
+        return
+    title = identify_title(job, output)
+    if title:
+        apply_title(output, title)
+
+def apply_title(output: str, title: str):
+    """ Rename a finished recording to include the title.
+
+    Args:
+        output (str): The recording to rename.
+        title (str): Text to insert before the extension.
+    """
+    dirname = os.path.dirname(output)
+    root_ext = os.path.splitext(os.path.basename(output))
+    new_title = root_ext[0] + title + root_ext[1]
+    new_path = os.path.join(dirname, new_title)
 
     # Rename the actual file.
-    rename_files(old_mp4,new_mp4)
-    # os.remove(old_mp4)
+    rename_files(output, new_path)
+
+def rename(job: RenameJob) -> str:
+    """ Handle the renaming process for a finished recording.
+
+        - First, parse the name of the recording OBS wrote.
+        - If OBS is going to remux it, wait for the remux to finish (inotify on Linux,
+          polling elsewhere).
+        - Get the title of the desired application.
+        - Rename whichever file is left. If nothing named the game, matching the frames
+          against the reference index is deferred to the idle scheduler.
+        - Finally, hand back the original so run_job() can journal it and delete it once
+          OBS is no longer encoding (see IdleScheduler).
+
+        All of this should be done on a separate thread to not block the main process.
+        Only the job is read here, never OBS, so this is safe to run anywhere.
+        Interrupted jobs are picked back up from the journal by resume_jobs().
+
+    Args:
+        job (RenameJob): Snapshot of the recording and settings taken when the event fired.
+
+    Returns:
+        str: The original recording, still to be deleted, or None.
+    """
+    output, leftover = finish_remux(job)
+    if not os.path.exists(output):
+        print("ERROR: Recording no longer exists, nothing to rename - " + output)
+        return None
+    title = make_title(job)
+    apply_title(output, title)
+    if not title and Data.FrameIndex is not None and job.mode in (0, 3):
+        defer_heavy(identify_later, job, output)
+    return leftover
+
+async def rename_async(job: RenameJob) -> str:
+    """ Coroutine version of rename() for the asyncio engine.
+
+    Waits are awaited on the engine's loop, and the blocking title lookup and rename
+    run on its executor.
+
+    Args:
+        job (RenameJob): Snapshot of the recording and settings taken when the event fired.
+
+    Returns:
+        str: The original recording, still to be deleted, or None.
+    """
+    output, leftover = await finish_remux_async(job)
+    if not await run_blocking(os.path.exists, output):
+        print("ERROR: Recording no longer exists, nothing to rename - " + output)
+        return None
+    title = await run_blocking(make_title, job)
+    await run_blocking(apply_title, output, title)
+    if not title and Data.FrameIndex is not None and job.mode in (0, 3):
+        defer_heavy(identify_later, job, output)
+    return leftover
+
+def delete_leftover(key: str, leftover: str):
+    """ Idle scheduler task: delete an original recording, then close its journal entry.
+
+    Args:
+        key (str): The job key.
+        leftover (str): The original recording, whose remuxed copy has been renamed.
+    """
+    remove_when_released(leftover, debug=Data.Debug)
+    if Data.Journal is not None:
+        Data.Journal.record(key, DONE)
+
+def finish_job(job: RenameJob, leftover: str):
+    """ Record a finished rename, deferring the delete of the original if there is one.
+
+    The delete is journaled first, so if OBS exits before the scheduler gets to it the
+    next load replays it instead of leaving the original behind.
+
+    Args:
+        job (RenameJob): The job that ran.
+        leftover (str): The original recording still to delete, or None.
+    """
+    journal = Data.Journal
+    if leftover:
+        if journal is not None:
+            journal.record(job.key, DELETING, dict(job.to_dict(), leftover=leftover))
+        defer_heavy(delete_leftover, job.key, leftover)
+    elif journal is not None:
+        journal.record(job.key, DONE)
+
+def run_job(job: RenameJob):
+    """ Thread pool handler. Runs rename() and records its progress in the journal.
+
+    Args:
+        job (RenameJob): The job to run.
+    """
+    journal = Data.Journal
+    if journal is not None:
+        journal.record(job.key, RUNNING)
+    try:
+        leftover = rename(job)
+    except Exception:
+        if journal is not None:
+            journal.record(job.key, FAILED)
+        raise
+    finish_job(job, leftover)
+
+async def run_job_async(job: RenameJob):
+    """ asyncio engine handler. Runs rename_async() and records its progress in the journal.
+
+    Args:
+        job (RenameJob): The job to run.
+    """
+    journal = Data.Journal
+    if journal is not None:
+        await run_blocking(journal.record, job.key, RUNNING)
+    try:
+        leftover = await rename_async(job)
+    except Exception:
+        if journal is not None:
+            await run_blocking(journal.record, job.key, FAILED)
+        raise
+    await run_blocking(finish_job, job, leftover)
+
+def get_pool():
+    """ The shared rename worker pool, created on first use.
+
+    Returns:
+        RenamePool | AsyncRenameEngine: Depending on the "Rename engine" setting.
+    """
+    if Data.Pool is None:
+        if Data.Engine == 1:
+            Data.Pool = AsyncRenameEngine(run_job_async, workers=Data.Workers, debug=Data.Debug,
+                                          initializer=worker_initializer())
+        else:
+            Data.Pool = RenamePool(run_job, workers=Data.Workers, debug=Data.Debug,
+                                   initializer=worker_initializer())
+    return Data.Pool
+
+def queue_job(job: RenameJob, priority: int=PRIORITY_NORMAL):
+    """ Hand a rename job to the worker pool and journal it.
+
+    The job is journaled only once the pool has accepted it, so a duplicate doesn't cost
+    an fsync, and before any worker can record it as running.
+
+    Args:
+        job (RenameJob): The job to run.
+        priority (int, optional): Lower runs first. Defaults to PRIORITY_NORMAL.
+    """
+    on_accept = None
+    if Data.Journal is not None:
+        on_accept = functools.partial(Data.Journal.record, job.key, PENDING, job.to_dict())
+    pool = get_pool()
+    if pool.submit(job.key, job, priority=priority, on_accept=on_accept) and Data.Debug:
+        print("Rename job queued! Queue depth - " + str(pool.queue_depth)
+              + "\tWorkers - " + str(pool.worker_count))
+
+def start_rename(path: str, replay: bool=False):
+    """ Snapshot everything the job needs and queue it. Runs on the OBS callback thread.
+
+    Args:
+        path (str): The recording as written by OBS.
+        replay (bool, optional): True for a replay buffer save. Defaults to False.
+    """
+    if not path:
+        return
+    auto_remux, rec_format = get_remux_settings()
+    game = sampled_game(replay) if Data.RenameMode in (0, 3) else ""
+    queue_job(make_job(path, mode=Data.RenameMode, channel=Data.ChannelName or "",
+                       replay=replay, auto_remux=auto_remux, rec_format=rec_format,
+                       debug=Data.Debug, game=game))
+
+def resume_jobs(jobs: list):
+    """ Requeue jobs left unfinished by a previous session. Runs on a background thread.
+
+    A remux that was interrupted by a crash leaves a partial output behind, so the
+    original recording is never deleted for a resumed job. It is renamed as-is, unless
+    only the remuxed copy survived.
+
+    Jobs that only had the delete of the original left are handed straight back to
+    the idle scheduler. Renames queued longer ago than the orphan scan looks back
+    (orphan_scan.MAX_AGE) are given up on, since the title lookups would describe now,
+    not the recording. game_timeline.py's backfill can still name those.
+
+    Args:
+        jobs (list): Job dicts from RenameJournal.unfinished().
+    """
+    for data in jobs:
+        job = RenameJob.from_dict(data)
+        if data.get("leftover"):
+            if Data.Debug:
+                print("DEBUG: Resuming delete of original recording - " + data["leftover"])
+            defer_heavy(delete_leftover, job.key, data["leftover"])
+            continue
+        # created is 0 for jobs journaled before it was recorded, their age is unknown.
+        if job.created and time.time() - job.created > MAX_AGE:
+            print("Rename job is too old to resume, leaving it as-is - " + job.path)
+            if Data.Journal is not None:
+                Data.Journal.record(job.key, FAILED)
+            continue
+        remux_path = job.remux_path
+        if os.path.exists(job.path):
+            job = job._replace(auto_remux=False)
+        elif not (remux_path and os.path.exists(remux_path)):
+            # Both are gone, the rename already happened.
+            if Data.Journal is not None:
+                Data.Journal.record(job.key, DONE)
+            continue
+        if Data.Debug:
+            print("DEBUG: Resuming rename job - " + job.path)
+        queue_job(job)
+
+def scan_for_orphans(directory: str):
+    """ Queue low-priority renames for recordings a crash left unfinished.
+
+    Runs on a background thread. The detectors only know what is running now, so an
+    orphan is named from the game timeline for the time it was recorded, and left alone
+    if there is no timeline or no game overlaps it. Renamed orphans lose their bare
+    timestamp name, so they aren't found again on the next load. Orphans are renamed as
+    they are, nothing is deleted, since a leftover remux may be incomplete.
+
+    Args:
+        directory (str): The OBS recording output directory.
+    """
+    timeline = Data.Timeline
+    if timeline is None:
+        if Data.Debug:
+            print("DEBUG: No game timeline, leaving orphaned recordings alone.")
+        return
+    for kind, path in scan_orphans(directory, debug=Data.Debug):
+        replay = os.path.basename(path).startswith("Replay")
+        if replay and not Data.Replay_True:
+            continue
+        try:
+            game = timeline.dominant(*recording_times(path))
+        except OSError:
+            continue
+        if Data.Debug:
+            print("DEBUG: Found orphaned recording (" + kind + ") - " + path
+                  + "\tGame - " + str(game))
+        if not game:
+            continue
+        ext = os.path.splitext(path)[1].lstrip(".").lower()
+        # Mode 3 takes the game from the job, never from the detectors.
+        job = make_job(path, mode=3, channel=Data.ChannelName or "", replay=replay,
+                       auto_remux=False, rec_format=ext, debug=Data.Debug, game=game)
+        queue_job(job, priority=PRIORITY_LOW)
+
+def recover(jobs: list, directory: str):
+    """ Background startup work: resume journaled jobs, then look for orphans.
+
+    Args:
+        jobs (list): Job dicts from RenameJournal.unfinished().
+        directory (str): The OBS recording output directory. May be empty.
+    """
+    # Resuming creates the pool, which must start with the user's worker settings.
+    if not Data.Settled.wait(Data.SettleTimeout):
+        print("Settings were not applied in time, resuming renames with the defaults.")
+    if jobs:
+        resume_jobs(jobs)
+    if directory:
+        # Give OBS (and script_update) time to settle, then walk the disk once it is idle.
+        time.sleep(Data.OrphanScanDelay)
+        defer_heavy(scan_for_orphans, directory)
+
+def drain_pool():
+    """ Give queued renames a short deadline to finish, without blocking OBS shutdown.
+
+    Anything still outstanding stays in the journal and is resumed on the next load,
+    including deletes the idle scheduler had not got to yet.
+    """
+    if Data.Scheduler is not None:
+        Data.Scheduler.shutdown()
+        Data.Scheduler = None
+    if Data.Sampler is not None:
+        Data.Sampler.shutdown()
+        Data.Sampler = None
+    if Data.Pool is not None:
+        if not Data.Pool.shutdown(timeout=Data.ShutdownDeadline):
+            print("Rename jobs still running at shutdown, they will resume on the next load.")
+        Data.Pool = None
+    # After the pool, so a Twitch-mode rename in progress can still finish its lookup.
+    if Data.Twitch is not None:
+        Data.Twitch.close()
+        Data.Twitch = None
 
 def on_event(event):
     """ 
@@ -189,17 +825,28 @@ def on_event(event):
     Args:
         event (_type_): _description_
     """
+    if event in (OBS.OBS_FRONTEND_EVENT_RECORDING_STARTED,
+                 OBS.OBS_FRONTEND_EVENT_RECORDING_STOPPED,
+                 OBS.OBS_FRONTEND_EVENT_STREAMING_STARTED,
+                 OBS.OBS_FRONTEND_EVENT_STREAMING_STOPPED,
+                 OBS.OBS_FRONTEND_EVENT_REPLAY_BUFFER_STARTED,
+                 OBS.OBS_FRONTEND_EVENT_REPLAY_BUFFER_STOPPED):
+        update_output_state()
+
+    if event == OBS.OBS_FRONTEND_EVENT_RECORDING_STARTED:
+        Data.RecordingStarted = time.monotonic()
+
     if event == OBS.OBS_FRONTEND_EVENT_RECORDING_STOPPED:
-        thread = threading.Thread(target=rename, name="OBSRenamer")
-        thread.start()
-        if Data.Debug:
-            print("Rename thread started!")
+        start_rename(OBS.obs_frontend_get_last_recording())
 
     if event == OBS.OBS_FRONTEND_EVENT_REPLAY_BUFFER_SAVED:
-        thread = threading.Thread(target=rename)
-        thread.start()
-        if Data.Debug:
-            print("Rename thread started!")
+        if Data.Replay_True:
+            start_rename(OBS.obs_frontend_get_last_replay(), replay=True)
+        elif Data.Debug:
+            print("DEBUG: Replay buffer SAVED but we are not renaming replays. Skipping...")
+
+    if event in (OBS.OBS_FRONTEND_EVENT_EXIT, OBS.OBS_FRONTEND_EVENT_SCRIPTING_SHUTDOWN):
+        drain_pool()
 
     # if event == OBS.OBS_FRONTEND_EVENT_RECORDING_STARTED:
     #     if Data.Debug:
@@ -238,7 +885,52 @@ def script_description():
 
 def script_load(settings):
     """ OBS API Event called when the script is first loaded. """
+    Data.Predictor = RemuxPredictor(os.path.join(OBS.script_path(), "remux_history.json"))
+    Data.Journal = RenameJournal(os.path.join(OBS.script_path(), "rename_journal.jsonl"))
+    # Optional, built with frame_matcher.py from clips of each game. Needs NumPy and ffmpeg.
+    frames = os.path.join(OBS.script_path(), "frame_index.bin")
+    if os.path.exists(frames) and frame_matcher.available():
+        try:
+            Data.FrameIndex = frame_matcher.FrameIndex(frames)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}")
+    # Optional, built with steam_applist_db.py from a Steam app-list dump.
+    applist = os.path.join(OBS.script_path(), "steam_applist.db")
+    if os.path.exists(applist):
+        try:
+            Data.AppList = AppListDB(applist)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}")
     OBS.obs_frontend_add_event_callback(on_event)
+    update_output_state()
+    if sys.platform.startswith("linux"):
+        # Game changes are pushed from registry.vdf, so a rename never has to parse it.
+        # Every session is also logged, so old recordings can be named later. The sampler
+        # logs what the other detectors see while an output is active (log_game_change).
+        Data.Timeline = GameTimeline(os.path.join(OBS.script_path(), "game_timeline.bin"))
+        start_registry_watcher(on_start=Data.Timeline.game_started,
+                               on_stop=Data.Timeline.game_stopped, debug=Data.Debug)
+        rules = load_rules(os.path.join(OBS.script_path(), "process_rules.json"))
+        Data.Rules = ProcRuleScanner(RuleMatcher(rules), debug=Data.Debug)
+        Data.Launchers = ProcRuleScanner(LauncherIndex(debug=Data.Debug), debug=Data.Debug)
+
+    jobs = Data.Journal.unfinished()
+    directory = OBS.obs_frontend_get_current_record_output_path()
+    threading.Thread(target=recover, args=(jobs, directory), name="OBSRenamerRecover",
+                     daemon=True).start()
+
+
+def script_unload():
+    """ OBS API Event called when the script is unloaded or reloaded. """
+    stop_registry_watcher(timeout=Data.ShutdownDeadline)
+    if Data.Timeline is not None:
+        # Log the game still running, otherwise its session is lost.
+        Data.Timeline.game_stopped()
+    drain_pool()
+    # A reload opens a new journal and compacts the file, so let go of this one first.
+    if Data.Journal is not None:
+        Data.Journal.close()
+        Data.Journal = None
 
 
 def script_properties():
@@ -258,6 +950,8 @@ def script_properties():
         mode_p,"Twitch Stream title", 1)
     OBS.obs_property_list_add_int(
         mode_p, "Foreground Window Name", 2)
+    OBS.obs_property_list_add_int(
+        mode_p, "Best match from all game detectors", 3)
     # OBS.obs_property_list_add_int(
     #     mode_p, "Most active scene name", 3)
     # OBS.obs_property_list_add_int(
@@ -273,12 +967,54 @@ def script_properties():
         props,"twitch_channel","Twitch Channel",OBS.OBS_TEXT_DEFAULT)
     OBS.obs_properties_add_bool(
         props,"replay_true", "Rename Replays?")
+    OBS.obs_properties_add_bool(
+        props,"detect_registry", "Detect: Steam registry")
+    OBS.obs_properties_add_bool(
+        props,"detect_steam_env", "Detect: Steam/Proton processes")
+    OBS.obs_properties_add_bool(
+        props,"detect_rules", "Detect: process rules and emulators")
+    OBS.obs_properties_add_bool(
+        props,"detect_launchers", "Detect: Heroic/Lutris/Bottles")
+    OBS.obs_properties_add_int(
+        props,"workers", "Rename workers", 1, 8, 1)
+    OBS.obs_properties_add_int(
+        props,"max_defer", "Defer heavy work while live (max s)", 0, 3600, 30)
+    OBS.obs_properties_add_bool(
+        props,"low_priority", "Run workers at low priority (Linux)")
+    OBS.obs_properties_add_int(
+        props,"worker_nice", "Worker nice value", 0, 19, 1)
+    io_p = OBS.obs_properties_add_list(
+        props,"worker_io","Worker I/O priority",OBS.OBS_COMBO_TYPE_LIST,OBS.OBS_COMBO_FORMAT_INT)
+    OBS.obs_property_list_add_int(
+        io_p,"Idle", IOPRIO_CLASS_IDLE)
+    OBS.obs_property_list_add_int(
+        io_p,"Best-effort (lowest)", IOPRIO_CLASS_BE)
+    OBS.obs_property_list_add_int(
+        io_p,"Unchanged", IOPRIO_CLASS_NONE)
+    OBS.obs_properties_add_text(
+        props,"worker_cpus","Worker CPUs (e.g. 2-3,6)",OBS.OBS_TEXT_DEFAULT)
+    engine_p = OBS.obs_properties_add_list(
+        props,"engine","Rename engine",OBS.OBS_COMBO_TYPE_LIST,OBS.OBS_COMBO_FORMAT_INT)
+    OBS.obs_property_list_add_int(
+        engine_p,"Thread pool", 0)
+    OBS.obs_property_list_add_int(
+        engine_p,"Single asyncio loop", 1)
     OBS.obs_properties_add_bool(
         props,"debug", "Enable Debug")
 
     return props
 
 
+def script_defaults(settings):
+    """ OBS API Event called to fill in default values for the settings. """
+    OBS.obs_data_set_default_int(settings, "workers", 2)
+    OBS.obs_data_set_default_int(settings, "max_defer", 600)
+    OBS.obs_data_set_default_int(settings, "worker_nice", 10)
+    OBS.obs_data_set_default_int(settings, "worker_io", IOPRIO_CLASS_IDLE)
+    for name in Data.Detectors:
+        OBS.obs_data_set_default_bool(settings, "detect_" + name, True)
+
+
 def script_update(settings):
     """ OBS API Event called when the script is updated. """
     Data.DelayOld = Data.Delay
@@ -288,6 +1024,49 @@ def script_update(settings):
     Data.WindowCount = OBS.obs_data_get_int(settings,"windowcount") or 1
     Data.RenameMode = OBS.obs_data_get_int(settings,"mode")
     Data.ChannelName = OBS.obs_data_get_string(settings, "twitch_channel")
+    Data.Workers = OBS.obs_data_get_int(settings, "workers") or 2
+    Data.MaxDefer = float(OBS.obs_data_get_int(settings, "max_defer"))
+    for name in Data.Detectors:
+        Data.Detectors[name] = OBS.obs_data_get_bool(settings, "detect_" + name)
+        if Data.Fusion is not None:
+            Data.Fusion.set_enabled(name, Data.Detectors[name])
+    if Data.Fusion is not None:
+        Data.Fusion.debug = Data.Debug
+    # A thread's priority is applied once, when it starts. The pool is recycled below
+    # when this changes, the idle scheduler thread keeps the priority it started with.
+    low_priority = OBS.obs_data_get_bool(settings, "low_priority")
+    priority_key = (low_priority, OBS.obs_data_get_int(settings, "worker_nice"),
+                    OBS.obs_data_get_int(settings, "worker_io"),
+                    OBS.obs_data_get_string(settings, "worker_cpus"))
+    if low_priority:
+        Data.Priority = WorkerPriority(
+            nice=OBS.obs_data_get_int(settings, "worker_nice"),
+            io_class=OBS.obs_data_get_int(settings, "worker_io"),
+            cpus=parse_cpu_list(OBS.obs_data_get_string(settings, "worker_cpus")),
+            debug=Data.Debug)
+    else:
+        Data.Priority = None
+    if Data.Scheduler is not None:
+        Data.Scheduler.max_defer = Data.MaxDefer
+        Data.Scheduler.debug = Data.Debug
+        Data.Scheduler.initializer = worker_initializer()
+    if Data.Sampler is not None:
+        # Start or stop sampling if the rename mode changed mid-recording.
+        Data.Sampler.debug = Data.Debug
+        update_output_state()
+    engine = OBS.obs_data_get_int(settings, "engine")
+    if Data.Pool is not None and (engine != Data.Engine or priority_key != Data.PriorityKey):
+        # Let the old pool finish its jobs in the background, new jobs go to a new one
+        # started with the current engine and worker priority.
+        Data.Pool.shutdown(timeout=0)
+        Data.Pool = None
+    Data.Engine = engine
+    Data.PriorityKey = priority_key
+    if Data.Pool is not None:
+        Data.Pool.debug = Data.Debug
+        Data.Pool.initializer = worker_initializer()
+        Data.Pool.resize(Data.Workers)
+    Data.Settled.set()
 
     if Data.Debug:
         print("DEBUG: Script updating...")
@@ -302,12 +1081,15 @@ def script_update(settings):
         elif Data.RenameMode == 2:
             print("DEBUG: RenameMode - Active Scene(s) - " + str(Data.RenameMode))
         elif Data.RenameMode == 3:
-            print("DEBUG: RenameMode - Active Game/Window Capture Source(s) - " + str(Data.RenameMode))
+            print("DEBUG: RenameMode - Best match from all game detectors - " + str(Data.RenameMode))
+            print("DEBUG: Detectors - " + ", ".join(n for n, on in Data.Detectors.items() if on))
         elif Data.RenameMode == 4:
             print("DEBUG: RenameMode - OBS Profile Name - " + str(Data.RenameMode))
         elif Data.RenameMode == 5:
             print("DEBUG: RenameMode - OBS Scene Collection Name - " + str(Data.RenameMode))
         print("DEBUG: Rename Replays - " + str(Data.Replay_True))
+        print("DEBUG: Rename Workers - " + str(Data.Workers))
+        print("DEBUG: Rename Engine - " + ("asyncio" if Data.Engine == 1 else "Thread pool"))
 
     if Data.Delay != Data.DelayOld:
         if Data.Debug:
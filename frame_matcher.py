@@ -0,0 +1,325 @@
+""" @file frame_matcher.py
+    @author Sean Duffie
+    @brief Identify the game from the recording itself with perceptual hashes.
+
+    Cloud games, capture cards and some emulators are invisible to every process based
+    detector, but the picture still says what was played. A few frames are sampled from
+    the finished file (or a screenshot) with ffmpeg, scaled to 32x32 grayscale, and each
+    is reduced to a 64 bit DCT perceptual hash. The hashes are compared by Hamming
+    distance against a reference index of per-game hashes, and every frame close enough
+    to a reference votes for its game. A game needs MIN_SHARE of the votes to count.
+
+    Flat frames (black loading screens, fades) carry no picture, and all hash to nearly
+    the same value, so they are dropped before hashing, both when matching and when
+    building the index.
+
+    The index is packed: one uint64 array of hashes and a parallel uint32 array of game
+    ids, plus a string table of names. Matching k frames against n references is a
+    single vectorized XOR and popcount over a k x n array, which stays well under a
+    millisecond for thousands of references.
+
+    NumPy and ffmpeg are optional. Without them available() is False and nothing here
+    is used.
+
+    Usage:
+        python frame_matcher.py add frame_index.bin "Game Name" clip.mkv screenshot.png
+        python frame_matcher.py match frame_index.bin recording.mkv
+"""
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"OGRPH001"
+_HEADER = struct.Struct("<8sII")
+HASH_SIZE = 32
+FRAMES = 5
+# Hashes further apart than this (of 64 bits) are different pictures.
+MAX_DISTANCE = 10
+# Share of the sampled frames that must vote for a game before it is trusted.
+MIN_SHARE = 0.6
+# Frames whose pixel standard deviation (0-255 scale) is below this are flat.
+MIN_STD = 8.0
+FFMPEG_TIMEOUT = 20
+
+
+def available() -> bool:
+    """ True if NumPy and ffmpeg are both installed. """
+    return np is not None and shutil.which("ffmpeg") is not None
+
+
+def _dct_matrix():
+    """ The first 8 rows of the orthonormal 32 point DCT-II matrix. """
+    n = np.arange(HASH_SIZE)
+    k = np.arange(8)[:, None]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * HASH_SIZE)) * np.sqrt(2.0 / HASH_SIZE)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT = _dct_matrix() if np is not None else None
+_POPCOUNT8 = (np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+              if np is not None else None)
+_BITS = (np.uint64(1) << np.arange(64, dtype=np.uint64)) if np is not None else None
+
+
+def phash(frames) -> "np.ndarray":
+    """ Perceptual hashes of a batch of frames.
+
+    Args:
+        frames (np.ndarray): (n, 32, 32) grayscale frames.
+
+    Returns:
+        np.ndarray: (n,) uint64 hashes.
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1, HASH_SIZE, HASH_SIZE)
+    # Low 8x8 frequencies of the 2D DCT for every frame at once.
+    coeffs = (_DCT @ frames @ _DCT.T).reshape(len(frames), 64)
+    # The DC term only measures brightness, leave it out of the median.
+    medians = np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    bits = coeffs > medians
+    return (bits.astype(np.uint64) * _BITS).sum(axis=1, dtype=np.uint64)
+
+
+def hamming(queries, references) -> "np.ndarray":
+    """ Hamming distances between every query and every reference hash.
+
+    Args:
+        queries (np.ndarray): (k,) uint64 hashes.
+        references (np.ndarray): (n,) uint64 hashes.
+
+    Returns:
+        np.ndarray: (k, n) distances.
+    """
+    xor = np.bitwise_xor(np.asarray(queries, dtype=np.uint64)[:, None],
+                         np.asarray(references, dtype=np.uint64)[None, :])
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return _POPCOUNT8[xor.view(np.uint8)].reshape(xor.shape + (8,)).sum(axis=-1)
+
+
+def _ffmpeg_frame(path: str, seek: float=None) -> bytes:
+    """ One 32x32 grayscale frame as raw bytes, or None if ffmpeg couldn't produce it. """
+    cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+    if seek is not None:
+        cmd += ["-ss", f"{seek:.3f}"]
+    cmd += ["-i", path, "-frames:v", "1",
+            "-vf", f"scale={HASH_SIZE}:{HASH_SIZE},format=gray", "-f", "rawvideo", "-"]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_TIMEOUT, check=False)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"ERROR: ffmpeg failed on {path}: {e}")
+        return None
+    if len(result.stdout) != HASH_SIZE * HASH_SIZE:
+        return None
+    return result.stdout
+
+
+def _duration(path: str) -> float:
+    """ Length of a video in seconds, or None for images and unreadable files. """
+    if shutil.which("ffprobe") is None:
+        return None
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0",
+             path], capture_output=True, timeout=FFMPEG_TIMEOUT, check=False, text=True)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+
+
+def informative(frames, min_std: float=MIN_STD) -> "np.ndarray":
+    """ Drop flat frames, whose hash says nothing about the picture.
+
+    Args:
+        frames (np.ndarray): (n, 32, 32) grayscale frames.
+        min_std (float, optional): Smallest pixel standard deviation kept. Defaults to MIN_STD.
+
+    Returns:
+        np.ndarray: The frames with enough detail to hash.
+    """
+    frames = np.asarray(frames).reshape(-1, HASH_SIZE, HASH_SIZE)
+    return frames[frames.reshape(len(frames), -1).std(axis=1) >= min_std]
+
+
+def sample_frames(path: str, count: int=FRAMES) -> "np.ndarray":
+    """ Evenly spaced frames from a video, or the single frame of an image.
+
+    Args:
+        path (str): A recording or screenshot.
+        count (int, optional): Frames to take from a video. Defaults to FRAMES.
+
+    Returns:
+        np.ndarray: (n, 32, 32) uint8 frames, flat ones left out. Empty if nothing
+            useful could be decoded.
+    """
+    duration = _duration(path)
+    if duration and duration > 0:
+        # Skip the very start and end, which are often loading or menu screens.
+        seeks = [duration * (i + 1) / (count + 1) for i in range(count)]
+    else:
+        seeks = [None]
+    frames = [_ffmpeg_frame(path, seek) for seek in seeks]
+    frames = [np.frombuffer(f, dtype=np.uint8) for f in frames if f is not None]
+    if not frames:
+        return np.empty((0, HASH_SIZE, HASH_SIZE), dtype=np.uint8)
+    return informative(np.stack(frames).reshape(-1, HASH_SIZE, HASH_SIZE))
+
+
+class FrameIndex:
+    """ Packed reference index of per-game frame hashes. """
+    def __init__(self, path: str):
+        """ Load an index. A missing file is an empty index.
+
+        Args:
+            path (str): The index file.
+
+        Raises:
+            ValueError: If the file exists but is not a frame index, or is truncated.
+        """
+        self.path = path
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.game_ids = np.empty(0, dtype=np.uint32)
+        self.names = []
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, count, name_bytes = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a frame index")
+        if len(data) < _HEADER.size + 12 * count + name_bytes:
+            raise ValueError(f"{path} is truncated")
+        offset = _HEADER.size
+        self.hashes = np.frombuffer(data, dtype="<u8", count=count, offset=offset)
+        offset += 8 * count
+        self.game_ids = np.frombuffer(data, dtype="<u4", count=count, offset=offset)
+        offset += 4 * count
+        table = data[offset:offset + name_bytes].decode("utf-8")
+        self.names = table.split("\n")[:-1] if table else []
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, name: str, hashes):
+        """ Add reference hashes for a game.
+
+        Args:
+            name (str): The game name.
+            hashes (np.ndarray): uint64 hashes of frames from that game.
+        """
+        name = name.replace("\n", " ")
+        if name in self.names:
+            game_id = self.names.index(name)
+        else:
+            game_id = len(self.names)
+            self.names.append(name)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        self.hashes = np.concatenate([self.hashes, hashes])
+        self.game_ids = np.concatenate([self.game_ids,
+                                        np.full(len(hashes), game_id, dtype=np.uint32)])
+
+    def save(self):
+        """ Write the index, replacing the file atomically. """
+        table = "".join(name + "\n" for name in self.names).encode("utf-8")
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(self.hashes), len(table)))
+            f.write(self.hashes.astype("<u8").tobytes())
+            f.write(self.game_ids.astype("<u4").tobytes())
+            f.write(table)
+        os.replace(tmp, self.path)
+
+    def match(self, hashes, max_distance: int=MAX_DISTANCE,
+              min_share: float=MIN_SHARE) -> tuple:
+        """ Vote for the game the frames came from.
+
+        Args:
+            hashes (np.ndarray): uint64 hashes of the frames to identify.
+            max_distance (int, optional): Largest Hamming distance that still counts as
+                the same picture. Defaults to MAX_DISTANCE.
+            min_share (float, optional): Share of the frames the winner needs. Defaults
+                to MIN_SHARE.
+
+        Returns:
+            tuple: (name, share of frames that voted for it), or (None, share) if no
+                game got enough votes.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes) or not len(self.hashes):
+            return None, 0.0
+        distances = hamming(hashes, self.hashes)
+        nearest = distances.argmin(axis=1)
+        close = distances[np.arange(len(hashes)), nearest] <= max_distance
+        if not close.any():
+            return None, 0.0
+        votes = np.bincount(self.game_ids[nearest[close]], minlength=len(self.names))
+        winner = int(votes.argmax())
+        share = float(votes[winner]) / len(hashes)
+        if share < min_share:
+            return None, share
+        return self.names[winner], share
+
+    def identify(self, path: str, frames: int=FRAMES) -> tuple:
+        """ Sample a recording or screenshot and match it against the index.
+
+        Args:
+            path (str): The file.
+            frames (int, optional): Frames to sample from a video. Defaults to FRAMES.
+
+        Returns:
+            tuple: (name, confidence), or (None, confidence) if nothing matched well enough.
+        """
+        sampled = sample_frames(path, frames)
+        if not len(sampled):
+            return None, 0.0
+        return self.match(phash(sampled))
+
+
+def main(argv: list=None) -> int:
+    """ Command line entry point: build or query a frame index. """
+    parser = argparse.ArgumentParser(description="Perceptual-hash game identification.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add reference frames for a game.")
+    add.add_argument("index", help="Index file.")
+    add.add_argument("name", help="Game name.")
+    add.add_argument("files", nargs="+", help="Recordings or screenshots of the game.")
+    match = commands.add_parser("match", help="Identify the game in recordings.")
+    match.add_argument("index", help="Index file.")
+    match.add_argument("files", nargs="+", help="Recordings or screenshots.")
+    args = parser.parse_args(argv)
+
+    if not available():
+        print("ERROR: frame matching needs NumPy and ffmpeg.")
+        return 1
+    try:
+        index = FrameIndex(args.index)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"ERROR: {e}")
+        return 1
+    if args.command == "add":
+        for path in args.files:
+            frames = sample_frames(path)
+            if not len(frames):
+                print(f"{path}: no usable frames, skipped")
+                continue
+            index.add(args.name, phash(frames))
+            print(f"{path}: {len(frames)} frames")
+        index.save()
+        print(f"{len(index)} reference hashes, {len(index.names)} games")
+        return 0
+    for path in args.files:
+        name, confidence = index.identify(path)
+        print(f"{path}\t{name or '-'}\t{confidence:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+""" @file game_fusion.py
+    @author Sean Duffie
+    @brief Combine every game detector into one best guess.
+
+    The Steam registry, the process environment, the process rules and the launcher
+    databases can each see a different game, or none. GameFusion asks the enabled
+    detectors in order of cost. Every answer is a Candidate with a confidence, and
+    detectors that agree on a name reinforce each other (1 - product of 1 - confidence).
+    As soon as one name is above the threshold, the remaining, more expensive detectors
+    are skipped.
+
+    A candidate that came from a specific process carries its (pid, start time). A
+    confident verdict is cached against that process. While the game keeps running and
+    no detector sees a process that started after it, the next detection costs a stat
+    read plus each detector's cheap newest-process check, with no name lookups.
+"""
+import threading
+from typing import NamedTuple
+
+import proc_scanner
+
+THRESHOLD = 0.9
+
+
+class Candidate(NamedTuple):
+    """ One detector's answer. """
+    name: str
+    confidence: float
+    source: str = ""
+    # (pid, starttime) of the process the answer came from, if any.
+    anchor: tuple = None
+
+
+class Detector(NamedTuple):
+    """ A named probe returning a Candidate or None, and its relative cost. """
+    name: str
+    probe: object
+    cost: float = 1.0
+    # Cheap callable returning the (pid, starttime) the probe would answer about now,
+    # or None. Lets a cached verdict be dropped as soon as a newer game starts.
+    newest: object = None
+
+
+class GameFusion:
+    """ Cost-ordered, early-stopping combination of detectors. Thread safe. """
+    def __init__(self, detectors: list=(), threshold: float=THRESHOLD,
+                 proc: str=proc_scanner.PROC, debug: bool=False):
+        """ Create the fusion layer.
+
+        Args:
+            detectors (list, optional): Detector tuples. Order doesn't matter.
+            threshold (float, optional): Confidence at which to stop asking. Defaults to 0.9.
+            proc (str, optional): Mount point of procfs. Defaults to "/proc".
+            debug (bool, optional): Print each detection. Defaults to False.
+        """
+        self.threshold = threshold
+        self.proc = proc
+        self.debug = debug
+        self._detectors = sorted(detectors, key=lambda d: d.cost)
+        self._disabled = set()
+        self._lock = threading.Lock()
+        self._cached = None
+
+    def set_enabled(self, name: str, enabled: bool):
+        """ Turn one detector on or off.
+
+        Args:
+            name (str): The detector's name.
+            enabled (bool): Whether it is asked.
+        """
+        with self._lock:
+            if enabled:
+                self._disabled.discard(name)
+            else:
+                self._disabled.add(name)
+            self._cached = None
+
+    def clear_cache(self):
+        """ Forget the cached verdict. """
+        with self._lock:
+            self._cached = None
+
+    def _cache_valid(self, cached: Candidate, detectors: list) -> bool:
+        """ True if the cached verdict's process still runs and no game started after it. """
+        pid, starttime = cached.anchor
+        stat = proc_scanner.read_stat(pid, self.proc)
+        if stat is None or stat[1] != starttime:
+            return False
+        for detector in detectors:
+            if detector.newest is None:
+                continue
+            try:
+                newest = detector.newest()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"ERROR: Game detector {detector.name} failed: {e}")
+                return False
+            if newest is not None and newest != cached.anchor and newest[1] >= starttime:
+                return False
+        return True
+
+    def detect(self) -> Candidate:
+        """ The best name for the game running now.
+
+        Returns:
+            Candidate: The fused verdict, with the combined confidence and every source
+                that agreed, or None if no detector found anything.
+        """
+        with self._lock:
+            cached = self._cached
+            detectors = [d for d in self._detectors if d.name not in self._disabled]
+        if cached is not None:
+            if self._cache_valid(cached, detectors):
+                return cached
+            with self._lock:
+                if self._cached is cached:
+                    self._cached = None
+
+        # Per normalized name: [name, 1 - combined confidence, sources, anchor]
+        scores = {}
+        best = None
+        asked = []
+        for detector in detectors:
+            asked.append(detector.name)
+            try:
+                candidate = detector.probe()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"ERROR: Game detector {detector.name} failed: {e}")
+                continue
+            if candidate is None or not candidate.name:
+                continue
+            key = candidate.name.casefold()
+            score = scores.setdefault(key, [candidate.name, 1.0, [], None])
+            score[1] *= 1.0 - min(max(candidate.confidence, 0.0), 1.0)
+            score[2].append(candidate.source or detector.name)
+            if score[3] is None:
+                score[3] = candidate.anchor
+            if best is None or score[1] < best[1]:
+                best = score
+            if 1.0 - best[1] >= self.threshold:
+                break
+
+        if best is None:
+            if self.debug:
+                print("DEBUG: No detector found a game. Asked - " + ", ".join(asked))
+            return None
+        verdict = Candidate(best[0], 1.0 - best[1], "+".join(best[2]), best[3])
+        if self.debug:
+            print("DEBUG: Detected game \"" + verdict.name + "\" (" + verdict.source
+                  + f", confidence {verdict.confidence:.2f}). Asked - " + ", ".join(asked))
+        if verdict.anchor is not None and verdict.confidence >= self.threshold:
+            with self._lock:
+                self._cached = verdict
+        return verdict
@@ -0,0 +1,190 @@
+""" @file game_sampler.py
+    @author Sean Duffie
+    @brief Remember which game was running while OBS was recording.
+
+    A recording that starts in one game and ends in another, or a replay saved after
+    switching games, should be named after what was on screen, not what happens to be
+    running when the file is written. The sampler probes the current game on its own
+    thread while any output is active and keeps (monotonic time, game) pairs in a fixed
+    size ring buffer. dominant() then answers "which game was running longest between t0
+    and t1" by walking back only over the samples inside the window.
+
+    The probe rate adapts: it starts at min_interval after a change and backs off towards
+    max_interval while the game stays the same. Changes can also be passed on, so the
+    persistent GameTimeline logs what the detectors saw, not only what Steam reported.
+"""
+import array
+import threading
+import time
+
+CAPACITY = 4096
+MIN_INTERVAL = 1.0
+MAX_INTERVAL = 5.0
+BACKOFF = 1.5
+
+
+class GameSampler:
+    """ Background sampler of the running game with time-window queries. """
+    def __init__(self, probe, capacity: int=CAPACITY, min_interval: float=MIN_INTERVAL,
+                 max_interval: float=MAX_INTERVAL, name: str="OBSRenamerSampler",
+                 debug: bool=False, on_change=None):
+        """ Create the sampler. Its thread starts the first time outputs become active.
+
+        Args:
+            probe (callable): Returns the current game name, or None/"" if there is none.
+            capacity (int, optional): Samples kept. Defaults to CAPACITY.
+            min_interval (float, optional): Seconds between probes after a change.
+            max_interval (float, optional): Seconds between probes while nothing changes.
+            name (str, optional): Name of the sampler thread. Defaults to "OBSRenamerSampler".
+            debug (bool, optional): Print game changes. Defaults to False.
+            on_change (callable, optional): Called with (game, unix time) when a sample
+                differs from the one before it. Runs on the sampling thread.
+        """
+        self.probe = probe
+        self.on_change = on_change
+        self.capacity = max(2, int(capacity))
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.name = name
+        self.debug = debug
+        self._times = array.array("d", bytes(8 * self.capacity))
+        self._games = [None] * self.capacity
+        self._count = 0
+        self._next = 0
+        # Time the outputs went idle, which ends the newest sample. None while active.
+        self._stopped_at = time.monotonic()
+        self._active = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def active(self) -> bool:
+        """ True while the sampler is probing. """
+        return self._active
+
+    def set_active(self, active: bool):
+        """ Start or pause sampling. Call from the OBS callback thread; it never probes.
+
+        Args:
+            active (bool): True if recording, streaming or the replay buffer is active.
+        """
+        with self._cond:
+            if active == self._active or self._closed:
+                return
+            self._active = active
+            self._stopped_at = None if active else time.monotonic()
+            if active and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def shutdown(self, timeout: float=0.0) -> bool:
+        """ Stop sampling for good.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a probe in progress. Defaults to 0.
+
+        Returns:
+            bool: True if the sampler thread has exited.
+        """
+        with self._cond:
+            self._closed = True
+            self._active = False
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def sample(self) -> str:
+        """ Probe the game now and record it. Also usable from OBS.timer_add.
+
+        Returns:
+            str: The game that was recorded, or None.
+        """
+        try:
+            game = self.probe() or None
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"ERROR: Game probe failed: {e}")
+            game = None
+        self.record(time.monotonic(), game)
+        return game
+
+    def record(self, when: float, game: str):
+        """ Add one sample. Samples must be recorded in time order.
+
+        Args:
+            when (float): time.monotonic() of the sample.
+            game (str): The game running at that time, or None.
+        """
+        with self._cond:
+            changed = not self._count or self._games[self._next - 1] != game
+            if self.debug and self._count and changed:
+                print("DEBUG: Game changed to " + str(game))
+            self._times[self._next] = when
+            self._games[self._next] = game
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+        if changed and self.on_change is not None:
+            try:
+                self.on_change(game, time.time() - (time.monotonic() - when))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"ERROR: Game change callback failed: {e}")
+
+    def dominant(self, t0: float, t1: float=None) -> str:
+        """ The game that was running for the longest time between t0 and t1.
+
+        Each sample counts until the next one, but never longer than two probe intervals,
+        so a gap while outputs were idle doesn't count for the last game seen.
+
+        Args:
+            t0 (float): Start of the window, in time.monotonic() seconds.
+            t1 (float, optional): End of the window. Defaults to now.
+
+        Returns:
+            str: The game, or None if no game was seen in the window.
+        """
+        now = time.monotonic()
+        t1 = now if t1 is None else t1
+        longest = 2 * self.max_interval
+        totals = {}
+        with self._cond:
+            end = self._stopped_at if self._stopped_at is not None else now
+            index = self._next
+            for _ in range(self._count):
+                index = (index - 1) % self.capacity
+                start = self._times[index]
+                if start >= t1:
+                    end = start
+                    continue
+                overlap = min(end, t1, start + longest) - max(start, t0)
+                game = self._games[index]
+                if overlap > 0 and game is not None:
+                    totals[game] = totals.get(game, 0.0) + overlap
+                if start <= t0:
+                    break
+                end = start
+        if not totals:
+            return None
+        return max(totals, key=totals.get)
+
+    def _run(self):
+        """ Sampler thread main loop. """
+        interval = self.min_interval
+        last = None
+        while True:
+            with self._cond:
+                while not self._active and not self._closed:
+                    interval = self.min_interval
+                    self._cond.wait()
+                if self._closed:
+                    return
+            game = self.sample()
+            interval = (self.min_interval if game != last
+                        else min(interval * BACKOFF, self.max_interval))
+            last = game
+            with self._cond:
+                if not self._closed and self._active:
+                    self._cond.wait(interval)
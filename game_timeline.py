@@ -0,0 +1,342 @@
+""" @file game_timeline.py
+    @author Sean Duffie
+    @brief Persistent log of game sessions, for naming recordings after the fact.
+
+    Every game session the Steam watcher or the game sampler sees is appended to a
+    compact binary log of fixed-width records, (start, end, appid, name index) in wall-clock seconds. Names live
+    in a separate append-only string table, one per line, so a game played a thousand
+    times is stored once. Only one session is open at a time, whichever source reports
+    it, so sessions never overlap, the records are sorted by both start and end, and
+    finding what ran during a recording is a binary search.
+
+    Recordings OBS only named with a timestamp can then be backfilled:
+        python game_timeline.py backfill /path/to/recordings [--dry-run]
+"""
+import argparse
+import array
+import bisect
+import datetime
+import os
+import os.path
+import struct
+import sys
+import threading
+import time
+
+from orphan_scan import BARE_NAME, RECORDING_EXTENSIONS
+
+MAGIC = b"OGRTL001"
+# start, end (float64 unix time), appid (0 if not a Steam app), name index.
+RECORD = struct.Struct("<ddQI")
+NAMES_SUFFIX = ".names"
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H-%M-%S", "%Y-%m-%d_%H-%M-%S")
+INVALID_CHARS = "`/<>\\:\"|?*"
+
+
+def _sync(fd: int):
+    """ Flush file data to disk, skipping metadata where the OS allows it. """
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+class GameTimeline:
+    """ Append-only game session log with time range lookups. Thread safe. """
+    def __init__(self, path: str):
+        """ Load the log. Both files are created on the first write.
+
+        Args:
+            path (str): The record file. The string table is path + ".names".
+        """
+        self.path = path
+        self.names_path = path + NAMES_SUFFIX
+        self._lock = threading.Lock()
+        self._starts = array.array("d")
+        self._ends = array.array("d")
+        self._appids = array.array("Q")
+        self._name_ids = array.array("I")
+        self._names = []
+        self._name_index = {}
+        # (start, appid, name) of the open session, guarded by _session_lock.
+        self._current = None
+        self._session_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """ Read both files into the in-memory arrays. """
+        try:
+            with open(self.names_path, "r", encoding="utf-8") as f:
+                self._names = f.read().split("\n")[:-1]
+        except OSError:
+            self._names = []
+        self._name_index = {name: i for i, name in enumerate(self._names)}
+
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if not data.startswith(MAGIC):
+            print("ERROR: Not a game timeline, ignoring - " + self.path)
+            return
+        body = memoryview(data)[len(MAGIC):]
+        # A torn final record from a crash is dropped.
+        body = body[:len(body) - len(body) % RECORD.size]
+        records = [r for r in RECORD.iter_unpack(body) if r[3] < len(self._names)]
+        records.sort()
+        for start, end, appid, name_id in records:
+            self._starts.append(start)
+            self._ends.append(end)
+            self._appids.append(appid)
+            self._name_ids.append(name_id)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def _name_id(self, name: str) -> int:
+        """ Index of a name in the string table, appending it if new. Lock must be held. """
+        name = name.replace("\n", " ").replace("\r", " ")
+        index = self._name_index.get(name)
+        if index is not None:
+            return index
+        # The name must be on disk before any record refers to it.
+        with open(self.names_path, "a", encoding="utf-8") as f:
+            f.write(name + "\n")
+            f.flush()
+            _sync(f.fileno())
+        index = len(self._names)
+        self._names.append(name)
+        self._name_index[name] = index
+        return index
+
+    def add(self, start: float, end: float, name: str, appid=0):
+        """ Append one finished session.
+
+        Args:
+            start (float): Session start, unix time.
+            end (float): Session end, unix time.
+            name (str): The game name.
+            appid (str | int, optional): The Steam appid. Defaults to 0.
+        """
+        if not name or end <= start:
+            return
+        try:
+            appid = int(appid or 0) & 0xFFFFFFFFFFFFFFFF
+        except ValueError:
+            appid = 0
+        with self._lock:
+            name_id = self._name_id(name)
+            new = not os.path.exists(self.path)
+            with open(self.path, "ab") as f:
+                if new:
+                    f.write(MAGIC)
+                f.write(RECORD.pack(start, end, appid, name_id))
+                f.flush()
+                _sync(f.fileno())
+            # Keep the arrays sorted even if the clock went backwards.
+            index = bisect.bisect_right(self._starts, start)
+            self._starts.insert(index, start)
+            self._ends.insert(index, end)
+            self._appids.insert(index, appid)
+            self._name_ids.insert(index, name_id)
+
+    def game_started(self, appid, name, when: float=None):
+        """ Open a session, closing a different open one first. Matches the RegistryWatcher
+        on_start callback. Reporting the game that is already open does nothing.
+
+        Args:
+            appid (str): The Steam appid, or 0 if unknown.
+            name (str): The game name, or None if unresolved.
+            when (float, optional): Unix time. Defaults to now.
+        """
+        when = when if when is not None else time.time()
+        with self._session_lock:
+            if self._current is not None and self._same(self._current, appid, name):
+                return
+            self._close_locked(when)
+            self._current = (when, appid, name)
+
+    def game_stopped(self, appid=None, name=None, when: float=None):
+        """ Close the open session and log it. Matches the RegistryWatcher on_stop callback.
+
+        Args:
+            appid (str, optional): The Steam appid. If it or the name is given, a session
+                for a different game is left open.
+            name (str, optional): The game name. Used if the start had none.
+            when (float, optional): Unix time. Defaults to now.
+        """
+        with self._session_lock:
+            current = self._current
+            if current is None or ((appid or name) and not self._same(current, appid, name)):
+                return
+            self._close_locked(when if when is not None else time.time(), name)
+
+    def game_seen(self, name: str, when: float=None):
+        """ Log the game a detector sees now, None for no game. Matches the GameSampler
+        on_change callback.
+
+        Args:
+            name (str): The game name, or None.
+            when (float, optional): Unix time of the change. Defaults to now.
+        """
+        if name:
+            self.game_started(0, name, when)
+        else:
+            self.game_stopped(when=when)
+
+    @staticmethod
+    def _same(current: tuple, appid, name: str) -> bool:
+        """ True if a report is about the open session's game, by appid or by name. """
+        _, current_appid, current_name = current
+        if appid and current_appid and str(appid) == str(current_appid):
+            return True
+        return bool(name and current_name and name == current_name)
+
+    def _close_locked(self, when: float, name: str=None):
+        """ Log the open session as ending at when. _session_lock must be held. """
+        current, self._current = self._current, None
+        if current is None:
+            return
+        start, appid, started_name = current
+        name = started_name or name or ("SteamApp" + str(appid) if appid else None)
+        self.add(start, when, name, appid)
+
+    def overlapping(self, t0: float, t1: float) -> list:
+        """ Games that ran between t0 and t1, longest first.
+
+        A zero-length range (t1 <= t0) returns the session containing t0.
+
+        Args:
+            t0 (float): Range start, unix time.
+            t1 (float): Range end, unix time.
+
+        Returns:
+            list: (name, appid, seconds of overlap) tuples.
+        """
+        t1 = max(t0, t1)
+        totals = {}
+        with self._lock:
+            # Sessions don't overlap, so ends are sorted too.
+            index = bisect.bisect_left(self._ends, t0)
+            while index < len(self._starts) and self._starts[index] <= t1:
+                start, end = self._starts[index], self._ends[index]
+                overlap = min(end, t1) - max(start, t0)
+                if overlap >= 0:
+                    key = (self._names[self._name_ids[index]], self._appids[index])
+                    totals[key] = totals.get(key, 0.0) + overlap
+                index += 1
+        return sorted(((name, appid, seconds) for (name, appid), seconds in totals.items()),
+                      key=lambda item: -item[2])
+
+    def dominant(self, t0: float, t1: float) -> str:
+        """ The game that ran for the longest time between t0 and t1.
+
+        Returns:
+            str: The game name, or None if no session overlaps the range.
+        """
+        games = self.overlapping(t0, t1)
+        return games[0][0] if games else None
+
+
+def recording_times(path: str) -> tuple:
+    """ When a recording was made, from its OBS timestamp name and its mtime.
+
+    Args:
+        path (str): The recording.
+
+    Returns:
+        tuple: (start, end) in unix time. start is the mtime if the name has no timestamp.
+    """
+    end = os.path.getmtime(path)
+    root = os.path.splitext(os.path.basename(path))[0]
+    if root.startswith("Replay "):
+        root = root[len("Replay "):]
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            start = datetime.datetime.strptime(root[:19], fmt).timestamp()
+            break
+        except ValueError:
+            continue
+    else:
+        start = end
+    return min(start, end), end
+
+
+def clean_name(name: str) -> str:
+    """ Strip the characters GameNamer.clean_filename() removes. """
+    return "".join(c for c in name if c not in INVALID_CHARS)
+
+
+def backfill(timeline: GameTimeline, directory: str, dry_run: bool=False) -> int:
+    """ Append the game name to every timestamp-only recording under a directory.
+
+    Args:
+        timeline (GameTimeline): The session log.
+        directory (str): Root of the recording archive.
+        dry_run (bool, optional): Only print what would be renamed. Defaults to False.
+
+    Returns:
+        int: Recordings renamed (or that would be).
+    """
+    renamed = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            root, ext = os.path.splitext(filename)
+            if ext.lower() not in RECORDING_EXTENSIONS or not BARE_NAME.match(root):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                t0, t1 = recording_times(path)
+            except OSError:
+                continue
+            name = clean_name(timeline.dominant(t0, t1) or "")
+            if not name:
+                continue
+            new_path = os.path.join(dirpath, root + "_" + name + ext)
+            if os.path.exists(new_path):
+                print("Skipping, target already exists - " + new_path)
+                continue
+            print(path + " -> " + new_path)
+            if not dry_run:
+                try:
+                    os.rename(path, new_path)
+                except OSError as e:
+                    print(f"ERROR: {e}")
+                    continue
+            renamed += 1
+    return renamed
+
+
+def main(argv: list=None) -> int:
+    """ Command line entry point: backfill an archive or query the timeline. """
+    parser = argparse.ArgumentParser(description="Game session timeline.")
+    parser.add_argument("--timeline", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "game_timeline.bin"),
+        help="Timeline file. Defaults to the one next to this script.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill = commands.add_parser("backfill", help="Name timestamp-only recordings.")
+    fill.add_argument("directory", help="Root of the recording archive.")
+    fill.add_argument("--dry-run", action="store_true", help="Only print the renames.")
+    query = commands.add_parser("lookup", help="Show the games that ran during recordings.")
+    query.add_argument("paths", nargs="+", help="Recordings.")
+    args = parser.parse_args(argv)
+
+    timeline = GameTimeline(args.timeline)
+    if args.command == "backfill":
+        count = backfill(timeline, args.directory, args.dry_run)
+        print(("Would rename " if args.dry_run else "Renamed ") + str(count) + " recordings.")
+        return 0
+    for path in args.paths:
+        try:
+            t0, t1 = recording_times(path)
+        except OSError as e:
+            print(f"ERROR: {e}")
+            continue
+        games = ", ".join(f"{name} ({seconds:.0f}s)"
+                          for name, _, seconds in timeline.overlapping(t0, t1))
+        print(path + "\t" + (games or "-"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
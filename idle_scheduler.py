@@ -0,0 +1,121 @@
+""" @file idle_scheduler.py
+    @author Sean Duffie
+    @brief Defer heavy post-processing until OBS is not encoding.
+
+    Deleting multi-GB originals, scanning folders and similar work competes with the
+    encoder and muxer for the same disk and CPU. Work handed to the scheduler runs on
+    its own thread as soon as no output (recording, stream, replay buffer) is active,
+    or once it has been deferred for longer than the budget, whichever comes first.
+"""
+import collections
+import threading
+import time
+
+MAX_DEFER = 600.0
+
+
+class IdleScheduler:
+    """ Runs deferred tasks in order on one background thread while outputs are idle. """
+    def __init__(self, max_defer: float=MAX_DEFER, name: str="OBSRenamerIdle",
+                 debug: bool=False, initializer=None):
+        """ Create the scheduler. Its thread starts on the first deferred task.
+
+        Args:
+            max_defer (float, optional): Seconds a task may wait for the outputs to go idle
+                before it runs anyway. 0 never defers. Defaults to MAX_DEFER.
+            name (str, optional): Name of the scheduler thread. Defaults to "OBSRenamerIdle".
+            debug (bool, optional): Print progress messages. Defaults to False.
+            initializer (callable, optional): Called by the scheduler thread when it starts.
+        """
+        self.max_defer = max_defer
+        self.initializer = initializer
+        self.name = name
+        self.debug = debug
+        self._busy = False
+        self._tasks = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def busy(self) -> bool:
+        """ True while an OBS output is active. """
+        return self._busy
+
+    @property
+    def pending(self) -> int:
+        """ Tasks waiting to run. """
+        with self._cond:
+            return len(self._tasks)
+
+    def set_busy(self, busy: bool):
+        """ Record whether any OBS output is active. Call from the OBS callback thread.
+
+        Args:
+            busy (bool): True if recording, streaming or the replay buffer is active.
+        """
+        with self._cond:
+            if busy != self._busy and self.debug:
+                print("DEBUG: Outputs " + ("active, deferring" if busy else "idle, running")
+                      + " heavy work. Pending - " + str(len(self._tasks)))
+            self._busy = busy
+            self._cond.notify_all()
+
+    def defer(self, func, *args):
+        """ Run func(*args) on the scheduler thread once the outputs are idle.
+
+        Args:
+            func (callable): The heavy task.
+            *args: Its arguments.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._tasks.append((time.monotonic() + self.max_defer, func, args))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def shutdown(self, timeout: float=0.0) -> bool:
+        """ Stop accepting tasks. Tasks that have not started are dropped, so anything that
+        must survive an exit has to be journaled by the caller and deferred again on load.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a running task. Defaults to 0.
+
+        Returns:
+            bool: True if the scheduler thread has exited.
+        """
+        with self._cond:
+            self._closed = True
+            self._tasks.clear()
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _run(self):
+        """ Scheduler thread main loop. """
+        if self.initializer is not None:
+            self.initializer()
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._tasks:
+                        deadline = self._tasks[0][0]
+                        wait = deadline - time.monotonic()
+                        if not self._busy or wait <= 0:
+                            _, func, args = self._tasks.popleft()
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            try:
+                func(*args)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"ERROR: Deferred task {getattr(func, '__name__', func)} failed: {e}")
@@ -0,0 +1,305 @@
+""" @file launcher_index.py
+    @author Sean Duffie
+    @brief Name games launched through Heroic, Lutris or Bottles.
+
+    Each launcher keeps a local database of installed games: Heroic in JSON library files,
+    Lutris in a sqlite db plus one YAML file per game, Bottles in one YAML file per
+    bottle. LauncherIndex reads them all into two dicts, executable path -> title and
+    install directory -> title, and rebuilds them only when one of the source files'
+    mtime changes. A running process then resolves with a dict lookup on its executable
+    (or, failing that, one per parent directory).
+
+    LauncherIndex has the same match(exe, args) interface as process_rules.RuleMatcher,
+    so process_rules.ProcRuleScanner drives it over /proc.
+"""
+import glob
+import json
+import os
+import os.path
+import re
+import sqlite3
+import threading
+import time
+
+HOME = os.path.expanduser("~")
+HEROIC_CONFIGS = (
+    os.path.join(HOME, ".config", "heroic"),
+    os.path.join(HOME, ".var", "app", "com.heroicgameslauncher.hgl", "config", "heroic"),
+)
+LUTRIS_DATA = (
+    os.path.join(HOME, ".local", "share", "lutris"),
+    os.path.join(HOME, ".var", "app", "net.lutris.Lutris", "data", "lutris"),
+)
+LUTRIS_CONFIG = (
+    os.path.join(HOME, ".config", "lutris", "games"),
+    os.path.join(HOME, ".local", "share", "lutris", "games"),
+    os.path.join(HOME, ".var", "app", "net.lutris.Lutris", "config", "lutris", "games"),
+    os.path.join(HOME, ".var", "app", "net.lutris.Lutris", "data", "lutris", "games"),
+)
+BOTTLES_DATA = (
+    os.path.join(HOME, ".local", "share", "bottles", "bottles"),
+    os.path.join(HOME, ".var", "app", "com.usebottles.bottles", "data", "bottles", "bottles"),
+)
+# Used when a Wine process doesn't say which prefix it runs in.
+DEFAULT_WINEPREFIX = os.path.join(HOME, ".wine")
+REFRESH_INTERVAL = 2.0
+# Parent directories of an executable tried against the install directories.
+MAX_DEPTH = 6
+
+_YAML_EXE = re.compile(r"^\s+exe:\s*(.+?)\s*$", re.MULTILINE)
+_YAML_PROGRAM = re.compile(r"^\s+(name|path|folder):\s*(.+?)\s*$", re.MULTILINE)
+
+
+def _unquote(value: str) -> str:
+    """ Strip YAML quotes from a scalar. """
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    return value
+
+
+def _norm(path: str) -> str:
+    """ Canonical form used as a dict key. """
+    return os.path.normcase(os.path.realpath(os.path.expanduser(path)))
+
+
+def wine_to_unix(path: str, prefix: str=None) -> str:
+    """ Convert a path seen by a Wine program to a Unix path.
+
+    Drive letters are resolved through the prefix's dosdevices symlinks (C: is normally
+    drive_c inside the prefix, Z: the host root).
+
+    Args:
+        path (str): A path as seen by a Windows program.
+        prefix (str, optional): The Wine prefix the program runs in. Defaults to
+            DEFAULT_WINEPREFIX.
+
+    Returns:
+        str: The Unix path, or None if it isn't a drive path or the drive is unknown.
+    """
+    if len(path) < 3 or path[1] != ":" or not path[0].isalpha() or path[2] not in "\\/":
+        return None
+    rest = path[3:].replace("\\", "/")
+    drive = os.path.join(prefix or DEFAULT_WINEPREFIX, "dosdevices", path[0].lower() + ":")
+    if os.path.exists(drive):
+        return os.path.realpath(os.path.join(drive, rest))
+    if path[0] in "zZ":
+        return "/" + rest
+    return None
+
+
+def _load_json(path: str):
+    """ Parse a JSON file. None if it is missing or invalid. """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class LauncherIndex:
+    """ exe path / install directory -> title map over the local launcher databases. """
+    def __init__(self, debug: bool=False):
+        """ Create an empty index. It fills itself on the first match.
+
+        Args:
+            debug (bool, optional): Print index rebuilds. Defaults to False.
+        """
+        self.debug = debug
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._exes = {}
+        self._dirs = {}
+        self._last_refresh = None
+
+    @staticmethod
+    def source_files() -> list:
+        """ Every launcher database file that exists right now. """
+        files = []
+        for config in HEROIC_CONFIGS:
+            files += [os.path.join(config, "legendaryConfig", "legendary", "installed.json"),
+                      os.path.join(config, "gog_store", "installed.json"),
+                      os.path.join(config, "store_cache", "gog_library.json"),
+                      os.path.join(config, "sideload_apps", "library.json"),
+                      os.path.join(config, "nile_config", "nile", "installed.json"),
+                      os.path.join(config, "store_cache", "nile_library.json")]
+        for data in LUTRIS_DATA:
+            files.append(os.path.join(data, "pga.db"))
+        for config in LUTRIS_CONFIG:
+            files += glob.glob(os.path.join(glob.escape(config), "*.yml"))
+        for data in BOTTLES_DATA:
+            files += glob.glob(os.path.join(glob.escape(data), "*", "bottle.yml"))
+        return [f for f in files if os.path.isfile(f)]
+
+    def refresh(self):
+        """ Rebuild the index if any launcher database changed. """
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            sources = {}
+            for path in self.source_files():
+                try:
+                    sources[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+            if sources == self._sources:
+                return
+            self._sources = sources
+            exes, dirs = {}, {}
+            self._index_heroic(exes, dirs)
+            self._index_lutris(exes, dirs)
+            self._index_bottles(exes, dirs)
+            self._exes = {_norm(k): v for k, v in exes.items()}
+            self._dirs = {_norm(k): v for k, v in dirs.items()}
+            if self.debug:
+                print("DEBUG: Launcher index rebuilt - " + str(len(self._exes)) + " executables, "
+                      + str(len(self._dirs)) + " install directories")
+
+    @staticmethod
+    def _index_heroic(exes: dict, dirs: dict):
+        """ Heroic: Epic (legendary), GOG, Amazon (nile) and sideloaded apps. """
+        for config in HEROIC_CONFIGS:
+            # GOG and Amazon installs only know the app name, titles come from the library.
+            titles = {}
+            for library in ("gog_library.json", "nile_library.json"):
+                data = _load_json(os.path.join(config, "store_cache", library)) or {}
+                for game in data.get("games", []) if isinstance(data, dict) else []:
+                    if isinstance(game, dict) and game.get("app_name") and game.get("title"):
+                        titles[game["app_name"]] = game["title"]
+
+            legendary = _load_json(os.path.join(
+                config, "legendaryConfig", "legendary", "installed.json")) or {}
+            for game in legendary.values() if isinstance(legendary, dict) else []:
+                if not isinstance(game, dict) or not game.get("title"):
+                    continue
+                install = game.get("install_path")
+                if install:
+                    dirs[install] = game["title"]
+                    if game.get("executable"):
+                        exes[os.path.join(install, game["executable"])] = game["title"]
+
+            for store in (("gog_store", "installed.json"), ("nile_config", "nile", "installed.json")):
+                data = _load_json(os.path.join(config, *store)) or {}
+                installed = data.get("installed", data) if isinstance(data, dict) else data
+                for game in installed if isinstance(installed, list) else []:
+                    if not isinstance(game, dict):
+                        continue
+                    app = game.get("appName") or game.get("id")
+                    title = titles.get(app)
+                    install = game.get("install_path") or game.get("path")
+                    if title and install:
+                        dirs[install] = title
+
+            sideload = _load_json(os.path.join(config, "sideload_apps", "library.json")) or {}
+            for game in sideload.get("games", []) if isinstance(sideload, dict) else []:
+                if not isinstance(game, dict) or not game.get("title"):
+                    continue
+                executable = (game.get("install") or {}).get("executable")
+                if executable:
+                    exes[executable] = game["title"]
+                if game.get("folder_name"):
+                    dirs[game["folder_name"]] = game["title"]
+
+    @staticmethod
+    def _index_lutris(exes: dict, dirs: dict):
+        """ Lutris: installed games from pga.db, executables from each game's YAML. """
+        configs = {}
+        for config in LUTRIS_CONFIG:
+            for path in glob.glob(os.path.join(glob.escape(config), "*.yml")):
+                configs.setdefault(os.path.splitext(os.path.basename(path))[0], path)
+        for data in LUTRIS_DATA:
+            db = os.path.join(data, "pga.db")
+            if not os.path.isfile(db):
+                continue
+            try:
+                conn = sqlite3.connect("file:" + db + "?mode=ro", uri=True)
+                try:
+                    rows = conn.execute("SELECT name, directory, configpath FROM games "
+                                        "WHERE installed = 1").fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"ERROR: Could not read Lutris database {db}: {e}")
+                continue
+            for name, directory, configpath in rows:
+                if not name:
+                    continue
+                if directory:
+                    dirs[directory] = name
+                path = configs.get(configpath or "")
+                if path is None:
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        found = _YAML_EXE.search(f.read())
+                except OSError:
+                    continue
+                if found:
+                    exe = _unquote(found.group(1))
+                    if not os.path.isabs(exe) and directory:
+                        exe = os.path.join(directory, exe)
+                    exes[exe] = name
+
+    @staticmethod
+    def _index_bottles(exes: dict, dirs: dict):
+        """ Bottles: the External_Programs of every bottle. """
+        for data in BOTTLES_DATA:
+            for path in glob.glob(os.path.join(glob.escape(data), "*", "bottle.yml")):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        text = f.read()
+                except OSError:
+                    continue
+                start = text.find("External_Programs:")
+                if start < 0:
+                    continue
+                program = {}
+                # Each program is a mapping with name, path and folder keys, in any order.
+                for key, value in _YAML_PROGRAM.findall(text, start):
+                    if key in program:
+                        program = {}
+                    program[key] = _unquote(value)
+                    if "name" in program and "path" in program:
+                        exes[program["path"]] = program["name"]
+                        if program.get("folder"):
+                            dirs[program["folder"]] = program["name"]
+
+    def match(self, exe: str, args: list, prefix: str=None) -> str:
+        """ Title of the launcher game a process belongs to.
+
+        Args:
+            exe (str): Full path of the executable. May be empty.
+            args (list): The command line, as str.
+            prefix (str, optional): The Wine prefix of the process, to resolve drive
+                letters in its command line. Defaults to DEFAULT_WINEPREFIX.
+
+        Returns:
+            str: The title, or None if the process isn't a known launcher game.
+        """
+        last = self._last_refresh
+        if last is None or time.monotonic() - last >= REFRESH_INTERVAL:
+            self.refresh()
+        exes, dirs = self._exes, self._dirs
+        if not exes and not dirs:
+            return None
+        paths = [exe] if exe else []
+        if args:
+            paths.append(wine_to_unix(args[0], prefix) or args[0])
+        for path in paths:
+            title = exes.get(os.path.normcase(path))
+            if title is not None:
+                return title
+        for path in paths:
+            if not os.path.isabs(path):
+                continue
+            directory = os.path.normcase(os.path.dirname(path))
+            for _ in range(MAX_DEPTH):
+                title = dirs.get(directory)
+                if title is not None:
+                    return title
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+        return None
+
+    def __len__(self) -> int:
+        return len(self._exes) + len(self._dirs)
@@ -0,0 +1,145 @@
+""" @file linux_inotify.py
+    @author Sean Duffie
+    @brief Minimal ctypes wrapper around the Linux inotify API.
+
+    Only the handful of calls needed to watch a directory are wrapped. On any platform
+    without inotify, available() returns False and callers are expected to fall back
+    to polling.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    """ Load libc and declare the inotify prototypes.
+
+    Returns:
+        ctypes.CDLL: The C library, or None if inotify is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_LIBC = _load_libc()
+
+
+def available() -> bool:
+    """ Check whether inotify can be used on this system.
+
+    Returns:
+        bool: True if the inotify calls were found in libc.
+    """
+    return _LIBC is not None
+
+
+class Inotify:
+    """ A single non-blocking inotify instance. Usable as a context manager. """
+    def __init__(self):
+        if _LIBC is None:
+            raise OSError("inotify is not available on this platform")
+        self.fd = _LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def fileno(self) -> int:
+        """ File descriptor of the instance, for use with select/poll/asyncio. """
+        return self.fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """ Watch a path for the given events.
+
+        Args:
+            path (str): File or directory to watch.
+            mask (int): Bitwise OR of the IN_* event constants.
+
+        Returns:
+            int: The watch descriptor.
+        """
+        wd = _LIBC.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        """ Stop watching a previously added watch descriptor. """
+        _LIBC.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float=None) -> list:
+        """ Wait for and decode pending events.
+
+        Args:
+            timeout (float, optional): Seconds to wait. None blocks forever. Defaults to None.
+
+        Returns:
+            list: (wd, mask, cookie, name) tuples. Empty if the timeout expired.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+        return parse_events(buf)
+
+    def close(self):
+        """ Release the file descriptor and every watch attached to it. """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_events(buf: bytes) -> list:
+    """ Decode a buffer of raw inotify_event structs.
+
+    Args:
+        buf (bytes): Data read from an inotify file descriptor.
+
+    Returns:
+        list: (wd, mask, cookie, name) tuples.
+    """
+    events = []
+    offset = 0
+    while offset + _EVENT.size <= len(buf):
+        wd, mask, cookie, length = _EVENT.unpack_from(buf, offset)
+        offset += _EVENT.size
+        name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+        offset += length
+        events.append((wd, mask, cookie, name))
+    return events
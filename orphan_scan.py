@@ -0,0 +1,88 @@
+""" @file orphan_scan.py
+    @author Sean Duffie
+    @brief Find recordings a crash left behind without a game name.
+
+    OBS names recordings with a bare timestamp ("2024-01-31 20-15-42.mkv", or
+    "Replay 2024-..." for replays). Once renamed, a "_<title>" suffix is added, so any
+    recording that still has a bare timestamp name was never finished.
+
+    The scan walks the directory lazily with os.scandir in small batches, sleeping
+    between them, and stops after a fixed number of entries. Only recently modified files
+    are considered, so a huge archive of old recordings costs nothing beyond the walk.
+"""
+import os
+import os.path
+import re
+import time
+
+BARE_NAME = re.compile(r"^(?:Replay )?\d{4}-\d{2}-\d{2}[ _]\d{2}-\d{2}-\d{2}$")
+RECORDING_EXTENSIONS = (".mkv", ".mp4", ".mov", ".flv", ".ts", ".m3u8", ".avi")
+
+UNREMUXED = "unremuxed"
+REMUX_LEFTOVER = "remux_leftover"
+UNRENAMED = "unrenamed"
+
+BATCH_SIZE = 256
+BATCH_PAUSE = 0.02
+MAX_ENTRIES = 50000
+# Files newer than this may still be written by OBS, older ones predate the crash.
+MIN_AGE = 60.0
+MAX_AGE = 24 * 60 * 60.0
+
+
+def scan_orphans(directory: str, batch_size: int=BATCH_SIZE, pause: float=BATCH_PAUSE,
+                 max_entries: int=MAX_ENTRIES, min_age: float=MIN_AGE,
+                 max_age: float=MAX_AGE, debug: bool=False):
+    """ Classify leftover recordings in a directory.
+
+    Args:
+        directory (str): The OBS recording output directory.
+        batch_size (int, optional): Entries examined between pauses.
+        pause (float, optional): Seconds to sleep between batches.
+        max_entries (int, optional): Stop after examining this many entries.
+        min_age (float, optional): Skip files modified less than this many seconds ago.
+        max_age (float, optional): Skip files modified more than this many seconds ago.
+        debug (bool, optional): Print progress messages. Defaults to False.
+
+    Yields:
+        tuple: (kind, path) where kind is UNREMUXED, REMUX_LEFTOVER or UNRENAMED.
+    """
+    now = time.time()
+    # Bare-named recordings grouped by name without extension, to spot companions.
+    groups = {}
+    seen = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                seen += 1
+                if seen > max_entries:
+                    if debug:
+                        print("DEBUG: Orphan scan stopped after " + str(max_entries) + " entries.")
+                    break
+                if seen % batch_size == 0:
+                    time.sleep(pause)
+
+                root, ext = os.path.splitext(entry.name)
+                ext = ext.lower()
+                if ext not in RECORDING_EXTENSIONS or not BARE_NAME.match(root):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    age = now - entry.stat().st_mtime
+                except OSError:
+                    continue
+                if min_age <= age <= max_age:
+                    groups.setdefault(root, {})[ext] = entry.path
+    except OSError as e:
+        print(f"ERROR: Orphan scan failed for {directory}: {e}")
+        return
+
+    for files in groups.values():
+        if ".mp4" in files and len(files) > 1:
+            # The remux finished (or died), but the original was never deleted.
+            for ext, path in files.items():
+                yield (UNRENAMED if ext == ".mp4" else REMUX_LEFTOVER), path
+        else:
+            for ext, path in files.items():
+                yield (UNRENAMED if ext in (".mp4", ".mov") else UNREMUXED), path
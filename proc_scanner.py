@@ -0,0 +1,266 @@
+""" @file proc_scanner.py
+    @author Sean Duffie
+    @brief Find running Steam and Proton games from /proc.
+
+    Steam starts every game with SteamAppId (and, under Proton, STEAM_COMPAT_APP_ID) in
+    its environment, under a "reaper" process whose command line carries "AppId=<id>".
+    Both survive when registry.vdf is stale.
+
+    OBS itself is never a game, even when Steam launched it and it carries SteamAppId:
+    its own process, everything it spawns (ffmpeg, ffprobe) and anything with its own
+    appid (the reaper above it) are skipped.
+
+    Reading environ for every process is expensive, so verdicts are remembered per
+    (pid, start time). A poll lists /proc and only inspects pids it hasn't seen, so in
+    steady state it costs one listdir plus one stat read per game process. A process
+    that didn't match is inspected again while it is younger than RECHECK_GRACE, since
+    it may not have exec'd its real program (or set its environment) yet.
+
+    IncrementalScanner holds that bookkeeping. ProcGameScanner here and
+    process_rules.ProcRuleScanner only say how to inspect one process.
+"""
+import os
+import sys
+import threading
+
+PROC = "/proc"
+# Checked in order. SteamGameId is the 64-bit game id, which names non-Steam shortcuts.
+ENV_KEYS = (b"SteamAppId", b"STEAM_COMPAT_APP_ID", b"SteamGameId")
+REAPER_APPID = b"AppId="
+# Seconds after its start during which an unmatched process is inspected again.
+RECHECK_GRACE = 10.0
+try:
+    CLK_TCK = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    CLK_TCK = 100
+
+
+def available() -> bool:
+    """ True where /proc can be scanned. """
+    return sys.platform.startswith("linux") and os.path.isdir(PROC)
+
+
+def _read(path: str) -> bytes:
+    """ Read a small /proc file. None if the process is gone or off limits. """
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_stat(pid: int, proc: str=PROC) -> tuple:
+    """ Parent pid and start time of a process.
+
+    Args:
+        pid (int): The process id.
+        proc (str, optional): Mount point of procfs. Defaults to "/proc".
+
+    Returns:
+        tuple: (int ppid, int starttime in clock ticks), or None if the process is gone.
+    """
+    data = _read(os.path.join(proc, str(pid), "stat"))
+    if not data:
+        return None
+    # comm may contain spaces and parentheses, so split after the last ")".
+    fields = data[data.rfind(b")") + 2:].split()
+    try:
+        return int(fields[1]), int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def uptime_ticks(proc: str=PROC) -> float:
+    """ Time since boot in clock ticks, the unit of a process's start time.
+
+    Args:
+        proc (str, optional): Mount point of procfs. Defaults to "/proc".
+
+    Returns:
+        float: The uptime, or None if it can't be read.
+    """
+    data = _read(os.path.join(proc, "uptime"))
+    try:
+        return float(data.split()[0]) * CLK_TCK
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _appid_from_environ(data: bytes) -> str:
+    """ The first non-zero Steam id in a NUL separated environment block. """
+    env = {}
+    for item in data.split(b"\0"):
+        key, _, value = item.partition(b"=")
+        if key in ENV_KEYS:
+            env[key] = value
+    for key in ENV_KEYS:
+        value = env.get(key, b"").strip()
+        if value.isdigit() and int(value) != 0:
+            return value.decode("ascii")
+    return None
+
+
+def _appid_from_reaper(data: bytes) -> str:
+    """ The AppId=<id> argument of a Steam reaper command line. """
+    args = data.split(b"\0")
+    if not args or not os.path.basename(args[0]).startswith(b"reaper"):
+        return None
+    for arg in args[1:]:
+        if arg.startswith(REAPER_APPID):
+            value = arg[len(REAPER_APPID):]
+            if value.isdigit() and int(value) != 0:
+                return value.decode("ascii")
+    return None
+
+
+def _own_appid() -> str:
+    """ The Steam id this process was launched with, if Steam launched it. """
+    environb = getattr(os, "environb", None)
+    if not environb:
+        return None
+    return _appid_from_environ(b"\0".join(k + b"=" + v for k, v in environb.items()))
+
+
+class IncrementalScanner:
+    """ Per-pid verdicts over /proc, updated incrementally. Thread safe via running().
+
+    Subclasses implement _inspect(pid). It returns None if the process is gone, or a
+    tuple whose first item is the start time and whose last item is the result, None
+    meaning the process didn't match.
+    """
+    def __init__(self, proc: str=PROC, debug: bool=False, grace: float=RECHECK_GRACE):
+        """ Create a scanner with no verdicts yet.
+
+        Args:
+            proc (str, optional): Mount point of procfs. Defaults to "/proc".
+            debug (bool, optional): Print matches as they are found. Defaults to False.
+            grace (float, optional): Seconds after its start during which an unmatched
+                process is inspected again. Defaults to RECHECK_GRACE.
+        """
+        self.proc = proc
+        self.debug = debug
+        self.grace = grace
+        self._lock = threading.Lock()
+        # pid -> (starttime, ..., result or None)
+        self._verdicts = {}
+
+    def _inspect(self, pid: int) -> tuple:
+        """ The verdict for one process. None if it is gone. """
+        raise NotImplementedError
+
+    def scan(self) -> dict:
+        """ Update the verdicts from the current process list. Not thread safe on its own.
+
+        Returns:
+            dict: pid -> result for every live process that matched.
+        """
+        try:
+            pids = {int(name) for name in os.listdir(self.proc) if name.isdigit()}
+        except OSError:
+            return {}
+        now = uptime_ticks(self.proc)
+        young = None if now is None else now - self.grace * CLK_TCK
+        verdicts = {}
+        for pid, verdict in self._verdicts.items():
+            if pid not in pids:
+                continue
+            if verdict[-1] is not None:
+                # Only matches are re-checked, so a reused pid can't keep a stale result.
+                stat = read_stat(pid, self.proc)
+                if stat is None or stat[1] != verdict[0]:
+                    continue
+            elif young is not None and verdict[0] >= young:
+                continue
+            verdicts[pid] = verdict
+        self._verdicts = verdicts
+        # Parents get lower pids unless the pid space wrapped, so this order lets
+        # children look up their parent's verdict in the same pass.
+        for pid in sorted(pids - verdicts.keys()):
+            verdict = self._inspect(pid)
+            if verdict is not None:
+                verdicts[pid] = verdict
+        return {pid: v[-1] for pid, v in verdicts.items() if v[-1] is not None}
+
+    def running(self) -> tuple:
+        """ The most recently started matching process.
+
+        Returns:
+            tuple: (pid, starttime, result), or None if nothing matches.
+        """
+        with self._lock:
+            found = self.scan()
+            if not found:
+                return None
+            newest = max(found, key=lambda pid: self._verdicts[pid][0])
+            return newest, self._verdicts[newest][0], found[newest]
+
+    def __len__(self) -> int:
+        return len(self._verdicts)
+
+
+class ProcGameScanner(IncrementalScanner):
+    """ Incremental scan of /proc for processes Steam launched. """
+    def __init__(self, proc: str=PROC, debug: bool=False, exclude: int=None):
+        """ Create a scanner with no verdicts yet.
+
+        Args:
+            proc (str, optional): Mount point of procfs. Defaults to "/proc".
+            debug (bool, optional): Print games as they are found. Defaults to False.
+            exclude (int, optional): Process that, with its descendants, is never a
+                game. Defaults to this process.
+        """
+        super().__init__(proc, debug)
+        self.exclude = os.getpid() if exclude is None else exclude
+        self.own_appid = _own_appid() if exclude is None else None
+        # Verdicts are (starttime, ppid, appid or None). The excluded process and its
+        # descendants seen so far:
+        self._excluded = set()
+
+    def _inspect(self, pid: int):
+        """ Work out which game a new process belongs to. None if it is gone. """
+        stat = read_stat(pid, self.proc)
+        if stat is None:
+            return None
+        ppid, starttime = stat
+        parent = self._verdicts.get(ppid)
+        if pid == self.exclude or (ppid in self._excluded and parent is not None
+                                   and parent[0] <= starttime):
+            self._excluded.add(pid)
+            return starttime, ppid, None
+        base = os.path.join(self.proc, str(pid))
+        appid = None
+        cmdline = _read(os.path.join(base, "cmdline"))
+        if cmdline:
+            appid = _appid_from_reaper(cmdline)
+        if appid is None:
+            environ = _read(os.path.join(base, "environ"))
+            if environ:
+                appid = _appid_from_environ(environ)
+        if appid is None:
+            # Children of the reaper belong to its game even if they reset the environment.
+            if parent is not None and parent[0] <= starttime:
+                appid = parent[2]
+        if appid is not None and appid == self.own_appid:
+            appid = None
+        if appid is not None and self.debug:
+            print("DEBUG: Process " + str(pid) + " belongs to Steam app " + appid)
+        return starttime, ppid, appid
+
+    def scan(self) -> dict:
+        """ Update the verdicts from the current process list. Not thread safe on its own.
+
+        Returns:
+            dict: pid -> appid for every live process that belongs to a game.
+        """
+        games = super().scan()
+        self._excluded &= self._verdicts.keys()
+        return games
+
+    def running_appid(self) -> str:
+        """ The appid of the most recently started game process.
+
+        Returns:
+            str: The appid, or None if no game is running.
+        """
+        found = self.running()
+        return found[2] if found is not None else None
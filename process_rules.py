@@ -0,0 +1,250 @@
+""" @file process_rules.py
+    @author Sean Duffie
+    @brief Name non-Steam games and emulators from the running processes.
+
+    A rules table maps executables to game names:
+
+        [
+            {"name": "Factorio", "exe": "factorio"},
+            {"name": "Celeste", "path": "/home/*/Games/Celeste/*"},
+            {"name": "{rom}", "emulator": "retroarch", "rom_ext": [".sfc", ".gba"]}
+        ]
+
+    "exe" matches the executable's file name (Wine games match on the Windows .exe in the
+    command line too), "path" is a glob over its full path (for Wine games, the Unix
+    path of the .exe, with drive letters resolved in the process's Wine prefix), and
+    "emulator" rules name the
+    game after the ROM passed on the command line. The whole table is compiled once: file
+    names and emulators into dicts, and every path glob into a single alternation regex.
+    Matching a process is therefore a couple of dict lookups plus one regex match, no
+    matter how many rules there are, and as in proc_scanner only new (or still young and
+    unmatched) pids are matched.
+"""
+import fnmatch
+import json
+import os
+import os.path
+import re
+
+import proc_scanner
+from launcher_index import wine_to_unix
+
+# Emulators known out of the box, with the ROM extensions they are launched with.
+DEFAULT_EMULATORS = {
+    "retroarch": (".sfc", ".smc", ".nes", ".gba", ".gbc", ".gb", ".n64", ".z64", ".md",
+                  ".gen", ".sms", ".pce", ".cue", ".chd", ".iso", ".zip", ".7z"),
+    "dolphin-emu": (".iso", ".gcm", ".wbfs", ".rvz", ".gcz", ".ciso", ".wad", ".dol", ".elf"),
+    "dolphin": (".iso", ".gcm", ".wbfs", ".rvz", ".gcz", ".ciso", ".wad", ".dol", ".elf"),
+    "pcsx2": (".iso", ".chd", ".cso", ".bin", ".gz"),
+    "pcsx2-qt": (".iso", ".chd", ".cso", ".bin", ".gz"),
+    "duckstation-qt": (".cue", ".chd", ".bin", ".iso", ".pbp", ".m3u"),
+    "ppsspp": (".iso", ".cso", ".pbp", ".elf"),
+    "ppssppsdl": (".iso", ".cso", ".pbp", ".elf"),
+    "rpcs3": (".iso", ".pkg", ".bin"),
+    "cemu": (".wud", ".wux", ".wua", ".rpx", ".iso"),
+    "ryujinx": (".nsp", ".xci", ".nca", ".nro"),
+    "yuzu": (".nsp", ".xci", ".nca", ".nro"),
+    "melonds": (".nds", ".dsi", ".zip"),
+    "mgba": (".gba", ".gbc", ".gb", ".zip"),
+    "mgba-qt": (".gba", ".gbc", ".gb", ".zip"),
+    "mupen64plus": (".n64", ".z64", ".v64"),
+}
+ROM_TEMPLATE = "{rom}"
+# Where Steam's Proton keeps the prefix of a game, relative to STEAM_COMPAT_DATA_PATH.
+PROTON_PREFIX = "pfx"
+
+
+def _exe_key(path: str) -> str:
+    """ Lower-case file name without a .exe suffix, for either path separator. """
+    name = path.replace("\\", "/").rsplit("/", 1)[-1].lower()
+    return name[:-4] if name.endswith(".exe") else name
+
+
+def load_rules(path: str) -> list:
+    """ Read a JSON rules table.
+
+    Args:
+        path (str): The rules file.
+
+    Returns:
+        list: Rule dicts. Empty if the file is missing or invalid.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f"ERROR: Could not read process rules {path}: {e}")
+        return []
+    if not isinstance(rules, list):
+        print("ERROR: Process rules must be a list - " + path)
+        return []
+    return [rule for rule in rules if isinstance(rule, dict)]
+
+
+class RuleMatcher:
+    """ A rules table compiled for single-pass matching. """
+    def __init__(self, rules: list=None, default_emulators: bool=True):
+        """ Compile the rules. Later rules override earlier ones for the same exe.
+
+        Args:
+            rules (list, optional): Rule dicts as described in the module docstring.
+            default_emulators (bool, optional): Include DEFAULT_EMULATORS. Defaults to True.
+        """
+        self._exes = {}
+        self._emulators = {}
+        if default_emulators:
+            for exe, extensions in DEFAULT_EMULATORS.items():
+                self._emulators[exe] = (ROM_TEMPLATE, frozenset(extensions))
+        patterns = []
+        self._path_names = []
+        for rule in rules or ():
+            name = rule.get("name")
+            if not name:
+                continue
+            if rule.get("emulator"):
+                extensions = rule.get("rom_ext") or DEFAULT_EMULATORS.get(
+                    _exe_key(rule["emulator"]), ())
+                self._emulators[_exe_key(rule["emulator"])] = (
+                    name, frozenset(e.lower() for e in extensions))
+            elif rule.get("exe"):
+                self._exes[_exe_key(rule["exe"])] = name
+            elif rule.get("path"):
+                patterns.append(f"(?P<r{len(self._path_names)}>{fnmatch.translate(rule['path'])})")
+                self._path_names.append(name)
+        self._paths = re.compile("|".join(patterns)) if patterns else None
+
+    def match(self, exe: str, args: list, prefix: str=None) -> str:
+        """ Name the game a process is running.
+
+        Args:
+            exe (str): Full path of the executable. May be empty.
+            args (list): The command line, as str.
+            prefix (str, optional): The Wine prefix of the process, to resolve drive
+                letters in its command line. Defaults to launcher_index.DEFAULT_WINEPREFIX.
+
+        Returns:
+            str: The game name, or None if no rule matches.
+        """
+        keys = [_exe_key(exe)] if exe else []
+        paths = [exe] if exe else []
+        # Under Wine the real program is the first argument, not /proc/<pid>/exe.
+        if args and args[0].lower().endswith(".exe"):
+            keys.append(_exe_key(args[0]))
+            if self._paths is not None:
+                paths.append(wine_to_unix(args[0], prefix) or args[0])
+        for key in keys:
+            name = self._exes.get(key)
+            if name is not None:
+                return name
+            emulator = self._emulators.get(key)
+            if emulator is not None:
+                name = self._rom_name(emulator, args)
+                if name is not None:
+                    return name
+        if self._paths is not None:
+            for path in paths:
+                found = self._paths.match(path)
+                if found is not None:
+                    return self._path_names[int(found.lastgroup[1:])]
+        return None
+
+    @staticmethod
+    def _rom_name(emulator: tuple, args: list) -> str:
+        """ Game name from the ROM an emulator was started with, or None without one. """
+        template, extensions = emulator
+        for arg in reversed(args[1:]):
+            root, ext = os.path.splitext(arg.replace("\\", "/").rsplit("/", 1)[-1])
+            if ext.lower() in extensions and root:
+                return template.replace(ROM_TEMPLATE, root)
+        return None
+
+
+def wine_prefix(pid: int, proc: str=proc_scanner.PROC) -> str:
+    """ The Wine prefix a process runs in.
+
+    WINEPREFIX is checked first, then Proton's STEAM_COMPAT_DATA_PATH, and finally the
+    process's working directory, which Wine sets inside the prefix's drive_c.
+
+    Args:
+        pid (int): The process id.
+        proc (str, optional): Mount point of procfs. Defaults to "/proc".
+
+    Returns:
+        str: The prefix directory, or None if it can't be told.
+    """
+    base = os.path.join(proc, str(pid))
+    try:
+        with open(os.path.join(base, "environ"), "rb") as f:
+            environ = f.read()
+    except OSError:
+        environ = b""
+    if environ:
+        env = dict(item.partition(b"=")[::2] for item in environ.split(b"\0"))
+        if env.get(b"WINEPREFIX"):
+            return os.fsdecode(env[b"WINEPREFIX"])
+        if env.get(b"STEAM_COMPAT_DATA_PATH"):
+            return os.path.join(os.fsdecode(env[b"STEAM_COMPAT_DATA_PATH"]), PROTON_PREFIX)
+    try:
+        directory = os.readlink(os.path.join(base, "cwd"))
+    except OSError:
+        return None
+    while True:
+        if os.path.isdir(os.path.join(directory, "dosdevices")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+class ProcRuleScanner(proc_scanner.IncrementalScanner):
+    """ Incremental /proc scan that matches each new process against a RuleMatcher. """
+    def __init__(self, matcher: RuleMatcher, proc: str=proc_scanner.PROC, debug: bool=False):
+        """ Create a scanner with no verdicts yet.
+
+        Args:
+            matcher (RuleMatcher): The compiled rules.
+            proc (str, optional): Mount point of procfs. Defaults to "/proc".
+            debug (bool, optional): Print matches as they are found. Defaults to False.
+        """
+        super().__init__(proc, debug)
+        self.matcher = matcher
+        # Verdicts are (starttime, name or None).
+
+    def _inspect(self, pid: int):
+        """ Match a new process. None if it is gone. """
+        stat = proc_scanner.read_stat(pid, self.proc)
+        if stat is None:
+            return None
+        base = os.path.join(self.proc, str(pid))
+        try:
+            exe = os.readlink(os.path.join(base, "exe"))
+        except OSError:
+            exe = ""
+        try:
+            with open(os.path.join(base, "cmdline"), "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            cmdline = b""
+        if not exe and not cmdline:
+            return stat[1], None
+        args = [os.fsdecode(arg) for arg in cmdline.split(b"\0") if arg]
+        # Only Windows programs need their prefix, and reading environ isn't free.
+        prefix = None
+        if args and args[0][1:3] in (":\\", ":/"):
+            prefix = wine_prefix(pid, self.proc)
+        name = self.matcher.match(exe, args, prefix)
+        if name is not None and self.debug:
+            print("DEBUG: Process " + str(pid) + " matched rule - " + name)
+        return stat[1], name
+
+    def running_title(self) -> str:
+        """ The name of the most recently started matching process.
+
+        Returns:
+            str: The game name, or None if nothing matches.
+        """
+        found = self.running()
+        return found[2] if found is not None else None
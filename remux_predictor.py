@@ -0,0 +1,125 @@
+""" @file remux_predictor.py
+    @author Sean Duffie
+    @brief Learn how fast each output directory remuxes and predict completion times.
+
+    Remux time is roughly linear in file size, with the slope set by the disk it runs on.
+    An exponentially weighted average of the observed bytes/sec is kept per output
+    directory and saved as JSON, so the estimates survive OBS restarts.
+"""
+import json
+import os
+import os.path
+import threading
+
+# Weight given to the newest sample in the running average.
+SMOOTHING = 0.3
+# Fraction of the predicted time to sleep before switching to fine-grained checks.
+SAFETY_FACTOR = 0.9
+# Ignore samples that are too small to say anything about throughput.
+MIN_SAMPLE_BYTES = 8 * 1024 * 1024
+MIN_SAMPLE_SECONDS = 0.05
+
+
+class RemuxPredictor:
+    """ Per-directory remux throughput history. Safe to share between worker threads. """
+    def __init__(self, history_path: str=None):
+        """ Create a predictor, loading any history saved at history_path.
+
+        Args:
+            history_path (str, optional): JSON file to persist to. None keeps the history
+                in memory only. Defaults to None.
+        """
+        self.history_path = history_path
+        self._rates = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key_for(path: str) -> str:
+        """ The history key for a recording: its normalized output directory. """
+        return os.path.normcase(os.path.abspath(os.path.dirname(path)))
+
+    def rate(self, path: str) -> float:
+        """ Learned throughput for the directory a recording lives in.
+
+        Args:
+            path (str): Any file in the output directory.
+
+        Returns:
+            float: Bytes per second, or None if nothing has been learned yet.
+        """
+        with self._lock:
+            return self._rates.get(self.key_for(path))
+
+    def predict(self, path: str, size: int) -> float:
+        """ Predict how long remuxing a recording will take.
+
+        Args:
+            path (str): The recording to be remuxed.
+            size (int): Its size in bytes.
+
+        Returns:
+            float: Seconds until the remux should be done, or None with no history.
+        """
+        rate = self.rate(path)
+        if not rate or size is None:
+            return None
+        return size / rate
+
+    def sleep_hint(self, path: str, size: int) -> float:
+        """ How long a waiter can safely sleep before it needs to start checking.
+
+        Args:
+            path (str): The recording to be remuxed.
+            size (int): Its size in bytes.
+
+        Returns:
+            float: Seconds to sleep. 0 when there is no history.
+        """
+        expected = self.predict(path, size)
+        if expected is None:
+            return 0.0
+        return expected * SAFETY_FACTOR
+
+    def record(self, path: str, size: int, seconds: float):
+        """ Add an observed remux to the history and persist it.
+
+        Args:
+            path (str): The recording that was remuxed.
+            size (int): Its size in bytes.
+            seconds (float): How long the remux took.
+        """
+        if size < MIN_SAMPLE_BYTES or seconds < MIN_SAMPLE_SECONDS:
+            return
+        sample = size / seconds
+        key = self.key_for(path)
+        with self._lock:
+            old = self._rates.get(key)
+            self._rates[key] = sample if old is None else old + SMOOTHING * (sample - old)
+        self.save()
+
+    def load(self):
+        """ Read the history file, ignoring it if it is missing or damaged. """
+        if not self.history_path:
+            return
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                rates = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self._rates = {str(k): float(v) for k, v in rates.items() if v}
+
+    def save(self):
+        """ Atomically write the history file. """
+        if not self.history_path:
+            return
+        with self._lock:
+            rates = dict(self._rates)
+        tmp_path = self.history_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(rates, f, indent=1)
+            os.replace(tmp_path, self.history_path)
+        except OSError as e:
+            print(f"ERROR: Could not save remux history: {e}")
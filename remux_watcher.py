@@ -0,0 +1,282 @@
+""" @file remux_watcher.py
+    @author Sean Duffie
+    @brief Wait for OBS to finish remuxing a recording.
+
+    On Linux the output directory is watched with inotify, so the wait ends as soon as
+    the kernel reports the remuxed file was closed. Everywhere else the old polling
+    loop is used, but it sleeps through the predicted remux time (see remux_predictor)
+    before it starts retrying.
+
+    Every wait has a coroutine twin (the *_async functions) for the asyncio engine, so
+    waiting on a remux doesn't have to hold a thread.
+"""
+import asyncio
+import os
+import os.path
+import time
+
+import linux_inotify
+
+POLL_INTERVAL = 0.1
+CREATE_TIMEOUT = 50.0
+IDLE_TIMEOUT = 30.0
+SETTLE_TIMEOUT = 1.0
+
+# True when waits end on kernel events, so their durations are exact.
+EVENT_DRIVEN = linux_inotify.available()
+
+# Containers OBS leaves alone when "Automatically remux to MP4" is enabled.
+NO_REMUX_EXTENSIONS = (".mp4", ".mov", ".avi")
+
+
+def remux_output_path(path: str, auto_remux: bool, rec_format: str="mkv") -> str:
+    """ Work out which file OBS's automatic remux will produce for a recording.
+
+    Mirrors the rules in OBSBasic::AutoRemux(): fragmented formats keep their container
+    and get a ".remuxed" suffix, mp4/mov/hybrid MP4 and lossless avi are never remuxed,
+    and everything else becomes an ".mp4" next to the original.
+
+    Args:
+        path (str): The file OBS just finished writing.
+        auto_remux (bool): Whether automatic remuxing is enabled in the profile.
+        rec_format (str, optional): The profile's recording format. Defaults to "mkv".
+
+    Returns:
+        str: Path of the remuxed file, or None if no remux will happen.
+    """
+    if not auto_remux or not path:
+        return None
+    root, ext = os.path.splitext(path)
+    if (rec_format or "").startswith("fragmented"):
+        return root + ".remuxed" + ext
+    if ext.lower() in NO_REMUX_EXTENSIONS:
+        return None
+    return root + ".mp4"
+
+
+def wait_for_remux(output: str, create_timeout: float=CREATE_TIMEOUT,
+                   idle_timeout: float=IDLE_TIMEOUT, debug: bool=False) -> bool:
+    """ Block until the remuxed file exists and has been fully written.
+
+    Args:
+        output (str): Path of the file the remux will produce.
+        create_timeout (float, optional): Seconds to wait for the file to appear.
+        idle_timeout (float, optional): Give up if the file sees no writes for this long.
+        debug (bool, optional): Print progress messages. Defaults to False.
+
+    Returns:
+        bool: True if the remuxed file is complete, False if the wait timed out.
+    """
+    if linux_inotify.available():
+        try:
+            return _wait_inotify(output, create_timeout, idle_timeout, debug)
+        except OSError as e:
+            if debug:
+                print(f"DEBUG: inotify unavailable ({e}), polling instead.")
+    return _wait_polling(output, create_timeout, debug)
+
+
+class _RemuxTracker:
+    """ Interprets inotify events for one remux output. Shared by the sync and async waits.
+
+    The watch must be armed before the tracker is created, so nothing that happens from
+    then on is missed. Only a close or a rename into place proves the remux finished. A
+    file that already exists and stays quiet may have been closed before we started, or
+    may belong to a stalled remux, so the wait fails and the original is kept.
+    """
+    MASK = (linux_inotify.IN_CREATE | linux_inotify.IN_MOVED_TO | linux_inotify.IN_MODIFY
+            | linux_inotify.IN_CLOSE_WRITE | linux_inotify.IN_ONLYDIR)
+
+    def __init__(self, output: str, create_timeout: float, idle_timeout: float):
+        self.output = output
+        self.name = os.path.basename(output)
+        self.idle_timeout = idle_timeout
+        self.created = os.path.exists(output)
+        timeout = SETTLE_TIMEOUT if self.created else create_timeout
+        self.deadline = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """ Seconds left before the wait should give up. """
+        return self.deadline - time.monotonic()
+
+    def feed(self, events: list) -> bool:
+        """ Process a batch of events.
+
+        Args:
+            events (list): Events from Inotify.read_events().
+
+        Returns:
+            bool: True once the output has been closed.
+        """
+        for _, event_mask, _, event_name in events:
+            if event_name != self.name:
+                continue
+            if event_mask & (linux_inotify.IN_CLOSE_WRITE | linux_inotify.IN_MOVED_TO):
+                return True
+            if event_mask & (linux_inotify.IN_CREATE | linux_inotify.IN_MODIFY):
+                # Writes are still happening, keep pushing the deadline out.
+                self.created = True
+                self.deadline = time.monotonic() + self.idle_timeout
+        return False
+
+    def expired(self) -> bool:
+        """ Result of a wait whose deadline passed without a close event. Always False. """
+        if self.created and os.path.exists(self.output):
+            print("Error: Could not confirm the remux finished, keeping the original - "
+                  + self.output)
+        else:
+            print("Error: The remux did not finish in time. Maybe the video was long?")
+        return False
+
+
+def _wait_inotify(output: str, create_timeout: float, idle_timeout: float, debug: bool) -> bool:
+    """ inotify implementation of wait_for_remux(). """
+    with linux_inotify.Inotify() as notify:
+        notify.add_watch(os.path.dirname(output) or ".", _RemuxTracker.MASK)
+        tracker = _RemuxTracker(output, create_timeout, idle_timeout)
+        if debug:
+            print("DEBUG: Waiting on remux (inotify)...\tRemux: " + output)
+
+        while True:
+            remaining = tracker.remaining()
+            if remaining <= 0:
+                return tracker.expired()
+            if tracker.feed(notify.read_events(remaining)):
+                if debug:
+                    print("DEBUG: Remux finished - " + output)
+                return True
+
+
+def _wait_polling(output: str, create_timeout: float, debug: bool) -> bool:
+    """ Polling implementation of wait_for_remux(). Only checks for the file to appear. """
+    check = int(create_timeout / POLL_INTERVAL)
+    while not os.path.exists(output):
+        if not check:
+            print("Error: The process hung for too long. Maybe the video was long?")
+            return False
+        check -= 1
+
+        if debug and check % 100 == 0:
+            print("Waiting on remux...\tRemux: " + output + "\n")
+
+        time.sleep(POLL_INTERVAL)
+    return True
+
+
+def remove_when_released(path: str, ready_at: float=None, debug: bool=False) -> int:
+    """ Delete a file, retrying while another process still holds it open.
+
+    On Windows the original recording cannot be removed until the remux has released it.
+    If the first attempt fails and a predicted completion time is known, the thread
+    sleeps until then in one go instead of waking up every POLL_INTERVAL.
+
+    Args:
+        path (str): File to delete.
+        ready_at (float, optional): time.monotonic() value when the remux is expected to
+            be nearly done. Defaults to None.
+        debug (bool, optional): Print progress messages. Defaults to False.
+
+    Returns:
+        int: Number of attempts that failed because the file was still in use.
+    """
+    busy = 0
+    while os.path.exists(path):
+        try:
+            os.remove(path)
+        except PermissionError:
+            busy += 1
+            remaining = ready_at - time.monotonic() if ready_at else 0
+            if debug and busy == 1:
+                print(f"Waiting for the remux to finish... (predicted {max(remaining, 0):.1f}s)")
+            time.sleep(max(remaining, POLL_INTERVAL))
+    return busy
+
+
+async def wait_for_remux_async(output: str, create_timeout: float=CREATE_TIMEOUT,
+                               idle_timeout: float=IDLE_TIMEOUT, debug: bool=False) -> bool:
+    """ Coroutine version of wait_for_remux(). The inotify descriptor is read by the loop.
+
+    Args:
+        output (str): Path of the file the remux will produce.
+        create_timeout (float, optional): Seconds to wait for the file to appear.
+        idle_timeout (float, optional): Give up if the file sees no writes for this long.
+        debug (bool, optional): Print progress messages. Defaults to False.
+
+    Returns:
+        bool: True if the remuxed file is complete, False if the wait timed out.
+    """
+    if linux_inotify.available():
+        try:
+            notify = linux_inotify.Inotify()
+        except OSError as e:
+            notify = None
+            if debug:
+                print(f"DEBUG: inotify unavailable ({e}), polling instead.")
+        if notify is not None:
+            with notify:
+                return await _wait_inotify_async(notify, output, create_timeout, idle_timeout, debug)
+
+    check = int(create_timeout / POLL_INTERVAL)
+    while not os.path.exists(output):
+        if not check:
+            print("Error: The process hung for too long. Maybe the video was long?")
+            return False
+        check -= 1
+        await asyncio.sleep(POLL_INTERVAL)
+    return True
+
+
+async def _wait_inotify_async(notify, output: str, create_timeout: float,
+                              idle_timeout: float, debug: bool) -> bool:
+    """ inotify implementation of wait_for_remux_async(). """
+    loop = asyncio.get_running_loop()
+    notify.add_watch(os.path.dirname(output) or ".", _RemuxTracker.MASK)
+    tracker = _RemuxTracker(output, create_timeout, idle_timeout)
+    readable = asyncio.Event()
+    loop.add_reader(notify.fileno(), readable.set)
+    if debug:
+        print("DEBUG: Waiting on remux (inotify, async)...\tRemux: " + output)
+    try:
+        while True:
+            remaining = tracker.remaining()
+            if remaining <= 0:
+                return tracker.expired()
+            try:
+                await asyncio.wait_for(readable.wait(), remaining)
+            except asyncio.TimeoutError:
+                continue
+            readable.clear()
+            if tracker.feed(notify.read_events(0)):
+                if debug:
+                    print("DEBUG: Remux finished - " + output)
+                return True
+    finally:
+        loop.remove_reader(notify.fileno())
+
+
+async def remove_when_released_async(path: str, ready_at: float=None, debug: bool=False) -> int:
+    """ Coroutine version of remove_when_released(). The delete itself runs in the executor.
+
+    Args:
+        path (str): File to delete.
+        ready_at (float, optional): time.monotonic() value when the remux is expected to
+            be nearly done. Defaults to None.
+        debug (bool, optional): Print progress messages. Defaults to False.
+
+    Returns:
+        int: Number of attempts that failed because the file was still in use.
+    """
+    loop = asyncio.get_running_loop()
+    busy = 0
+    while os.path.exists(path):
+        try:
+            await loop.run_in_executor(None, os.remove, path)
+        except FileNotFoundError:
+            break
+        except PermissionError:
+            busy += 1
+            remaining = ready_at - time.monotonic() if ready_at else 0
+            if debug and busy == 1:
+                print(f"Waiting for the remux to finish... (predicted {max(remaining, 0):.1f}s)")
+            await asyncio.sleep(max(remaining, POLL_INTERVAL))
+    return busy
@@ -0,0 +1,199 @@
+""" @file rename_engine.py
+    @author Sean Duffie
+    @brief Single-thread asyncio alternative to RenamePool.
+
+    All jobs run as coroutines on one background event loop. Waits (remux, retries,
+    network) are awaited instead of slept through, and the few blocking calls go through
+    a small thread pool executor. Dozens of concurrent jobs therefore cost one loop
+    thread plus the executor, instead of one thread each.
+
+    The public interface matches RenamePool, so GameNamer can use either.
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from rename_pool import PRIORITY_NORMAL
+
+
+class AsyncRenameEngine:
+    """ Runs coroutine jobs on a private event loop thread, deduplicated by key. """
+    def __init__(self, handler, workers: int=2, max_jobs: int=64, name: str="OBSRenamer",
+                 debug: bool=False, initializer=None):
+        """ Create the engine and start its loop thread.
+
+        Args:
+            handler (coroutine function): Awaited with the submitted arguments.
+            workers (int, optional): Executor threads for blocking calls. Defaults to 2.
+            max_jobs (int, optional): Jobs allowed to run at once. Defaults to 64.
+            name (str, optional): Name of the loop thread. Defaults to "OBSRenamer".
+            debug (bool, optional): Print progress messages. Defaults to False.
+            initializer (callable, optional): Called by the loop thread and each executor
+                thread when it starts.
+        """
+        self.handler = handler
+        self.initializer = initializer
+        self.debug = debug
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._waiting = 0
+        self._closed = False
+        self._workers = max(1, int(workers))
+        self._loop = asyncio.new_event_loop()
+        self._slots = None
+        self._background = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(max_jobs,), name=name,
+                                        daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    @property
+    def queue_depth(self) -> int:
+        """ Jobs waiting for a free slot. """
+        with self._lock:
+            return self._waiting
+
+    @property
+    def worker_count(self) -> int:
+        """ Threads the engine uses: the loop thread plus the executor. """
+        return (1 if self._thread.is_alive() else 0) + self._workers
+
+    @property
+    def in_flight(self) -> int:
+        """ Jobs queued or running. """
+        with self._lock:
+            return len(self._in_flight)
+
+    def submit(self, key, *args, priority: int=PRIORITY_NORMAL, on_accept=None) -> bool:
+        """ Schedule a job unless one with the same key is already pending or running.
+
+        Args:
+            key (hashable): Identity of the job, normally the source file path.
+            *args: Passed to the handler.
+            priority (int, optional): Anything above PRIORITY_NORMAL is background work
+                and runs one job at a time. Defaults to PRIORITY_NORMAL.
+            on_accept (callable, optional): Called with no arguments once the job is accepted,
+                before any worker can start it. Not called for a collapsed job.
+
+        Returns:
+            bool: True if the job was scheduled, False if it was collapsed or the engine is closed.
+        """
+        with self._lock:
+            if self._closed or key in self._in_flight:
+                if self.debug:
+                    print("DEBUG: Rename job already queued, skipping - " + str(key))
+                return False
+            self._in_flight.add(key)
+        if on_accept is not None:
+            self._accepted(key, on_accept)
+        with self._lock:
+            self._waiting += 1
+        asyncio.run_coroutine_threadsafe(self._job(key, args, priority), self._loop)
+        return True
+
+    def _accepted(self, key, on_accept):
+        """ Run a submit() callback, releasing the key again if it fails. """
+        try:
+            on_accept()
+        except BaseException:
+            with self._lock:
+                self._in_flight.discard(key)
+            raise
+
+    def resize(self, workers: int):
+        """ Change the number of executor threads used for blocking calls.
+
+        Args:
+            workers (int): The new executor size.
+        """
+        workers = max(1, int(workers))
+        if workers == self._workers or not self._thread.is_alive():
+            return
+        self._workers = workers
+        self._loop.call_soon_threadsafe(self._set_executor, workers)
+
+    def shutdown(self, timeout: float=None) -> bool:
+        """ Stop accepting jobs and wait for the scheduled ones to finish.
+
+        Jobs still running after the timeout keep going in the background, and the loop
+        stops by itself once they are done.
+
+        Args:
+            timeout (float, optional): Seconds to wait. None waits forever. Defaults to None.
+
+        Returns:
+            bool: True if the loop thread exited within the timeout.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self, max_jobs: int):
+        """ Loop thread main function. """
+        if self.initializer is not None:
+            self.initializer()
+        asyncio.set_event_loop(self._loop)
+        self._slots = asyncio.Semaphore(max_jobs)
+        self._background = asyncio.Semaphore(1)
+        self._set_executor(self._workers)
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_default_executor())
+            self._loop.close()
+
+    def _set_executor(self, workers: int):
+        """ Swap the loop's default executor. Must run on the loop thread. """
+        # pylint: disable=protected-access
+        old = self._loop._default_executor
+        self._loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="OBSRenamerIO",
+            initializer=self.initializer))
+        if old is not None:
+            old.shutdown(wait=False)
+
+    async def _job(self, key, args, priority: int):
+        """ Run one job once a slot is free. """
+        if priority > PRIORITY_NORMAL:
+            async with self._background:
+                await self._run_job(key, args)
+        else:
+            await self._run_job(key, args)
+
+    async def _run_job(self, key, args):
+        """ Run one job in a slot. """
+        async with self._slots:
+            with self._lock:
+                self._waiting -= 1
+            try:
+                await self.handler(*args)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"ERROR: Rename job failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
+
+    async def _drain(self):
+        """ Wait for every job to finish, then stop the loop. """
+        jobs = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        await asyncio.gather(*jobs, return_exceptions=True)
+        self._loop.stop()
+
+
+def run_blocking(func, *args):
+    """ Run a blocking call on the current loop's executor.
+
+    Args:
+        func (callable): The blocking function.
+        *args: Its arguments.
+
+    Returns:
+        asyncio.Future: Awaitable result of func(*args).
+    """
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
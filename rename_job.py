@@ -0,0 +1,68 @@
+""" @file rename_job.py
+    @author Sean Duffie
+    @brief Immutable snapshot of everything a rename job needs.
+
+    A RenameJob is built on the OBS callback thread when the recording event arrives.
+    Workers only ever look at the job, never at OBS or the script settings, so a second
+    recording stopping (or the user changing settings) can't change a job in flight.
+    Jobs are plain tuples, so they can be journaled, pickled or sent to another process.
+"""
+import time
+from typing import NamedTuple
+
+from remux_watcher import remux_output_path
+
+
+class RenameJob(NamedTuple):
+    """ One recording to rename. NamedTuple keeps it immutable and slotted. """
+    path: str
+    mode: int = None
+    channel: str = ""
+    replay: bool = False
+    auto_remux: bool = True
+    rec_format: str = "mkv"
+    debug: bool = False
+    # Wall-clock time the job was made, so resume_jobs() can tell stale jobs. 0 if unknown.
+    created: float = 0.0
+    # Game that was on screen for most of the recording, from the sampler. "" if unknown.
+    game: str = ""
+
+    @property
+    def key(self) -> str:
+        """ Jobs for the same source file are the same job. """
+        return self.path
+
+    @property
+    def remux_path(self) -> str:
+        """ The file OBS's auto-remux will produce, or None if it won't remux. """
+        return remux_output_path(self.path, self.auto_remux, self.rec_format)
+
+    def to_dict(self) -> dict:
+        """ JSON-friendly form for the journal. """
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RenameJob":
+        """ Rebuild a job from to_dict() output, ignoring unknown or missing fields.
+
+        Args:
+            data (dict): A journaled job.
+
+        Returns:
+            RenameJob: The job.
+        """
+        return cls(**{k: v for k, v in data.items() if k in cls._fields})
+
+
+def make_job(path: str, **fields) -> RenameJob:
+    """ Create a job stamped with the current wall-clock time.
+
+    Args:
+        path (str): The recording as written by OBS.
+        **fields: Any other RenameJob fields.
+
+    Returns:
+        RenameJob: The job.
+    """
+    fields.setdefault("created", time.time())
+    return RenameJob(path, **fields)
@@ -0,0 +1,146 @@
+""" @file rename_journal.py
+    @author Sean Duffie
+    @brief Crash-safe log of rename jobs so unfinished work survives an OBS exit.
+
+    The journal is an append-only JSON-lines file. Each line records one state change
+    for a job, keyed by the source path. Only the "pending" and "deleting" lines are
+    fsynced, since those are the ones that must never be lost. Losing a later "running"
+    or "done" line just means the job is replayed, and replaying a finished job is
+    harmless.
+
+    A job whose rename is done but whose original recording is still waiting for the
+    idle scheduler to delete it stays "deleting" until the delete has happened.
+"""
+import json
+import os
+import os.path
+import threading
+
+PENDING = "pending"
+RUNNING = "running"
+DELETING = "deleting"
+DONE = "done"
+FAILED = "failed"
+
+UNFINISHED = (PENDING, RUNNING, DELETING)
+# States that are fsynced as soon as they are written.
+DURABLE = (PENDING, DELETING)
+# Rewrite the file once this many lines have been written and nothing is outstanding.
+COMPACT_AFTER = 1000
+
+
+def _sync(fd: int):
+    """ Flush file data to disk, skipping metadata where the OS allows it. """
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+class RenameJournal:
+    """ Append-only journal of rename job state transitions. Thread safe. """
+    def __init__(self, path: str):
+        """ Open the journal, compacting away everything that already finished.
+
+        Args:
+            path (str): The journal file. Created if missing.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._states = {}
+        self._lines = 0
+        self._load()
+        self._rewrite()
+
+    def record(self, key: str, state: str, job: dict=None):
+        """ Append a state change for a job.
+
+        Args:
+            key (str): The job key, normally the source file path.
+            state (str): One of PENDING, RUNNING, DELETING, DONE or FAILED.
+            job (dict, optional): Everything needed to rerun the job. Required with PENDING
+                and DELETING.
+        """
+        entry = {"key": key, "state": state}
+        if job is not None:
+            entry["job"] = job
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+
+        with self._lock:
+            if job is not None:
+                self._jobs[key] = job
+            self._states[key] = state
+            if state not in UNFINISHED:
+                self._jobs.pop(key, None)
+                self._states.pop(key, None)
+            if self._fd < 0:
+                # Closed. Whatever a straggling worker reports is replayed on the next load.
+                return
+            try:
+                os.write(self._fd, line)
+                if state in DURABLE:
+                    _sync(self._fd)
+            except OSError as e:
+                print(f"ERROR: Could not write rename journal: {e}")
+            self._lines += 1
+            if not self._states and self._lines >= COMPACT_AFTER:
+                self._rewrite_locked()
+
+    def unfinished(self) -> list:
+        """ Jobs that were queued or running when the journal was last written.
+
+        Returns:
+            list: The job dicts, oldest first.
+        """
+        with self._lock:
+            return [self._jobs[k] for k in self._states if k in self._jobs]
+
+    def close(self):
+        """ Close the journal file. Later records are no longer written. """
+        with self._lock:
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+    def _load(self):
+        """ Replay the journal file into memory. Damaged lines are skipped. """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        key, state = entry["key"], entry["state"]
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    if "job" in entry:
+                        self._jobs[key] = entry["job"]
+                    if state in UNFINISHED:
+                        self._states[key] = state
+                    else:
+                        self._states.pop(key, None)
+                        self._jobs.pop(key, None)
+        except FileNotFoundError:
+            pass
+
+    def _rewrite(self):
+        """ Compact the journal and (re)open it for appending. """
+        with self._lock:
+            self._fd = -1
+            self._rewrite_locked()
+
+    def _rewrite_locked(self):
+        """ Atomically replace the file with only the outstanding jobs. Lock must be held. """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key in self._states:
+                if key in self._jobs:
+                    state = DELETING if self._states[key] == DELETING else PENDING
+                    f.write(json.dumps({"key": key, "state": state, "job": self._jobs[key]}) + "\n")
+            f.flush()
+            _sync(f.fileno())
+        if self._fd >= 0:
+            os.close(self._fd)
+        os.replace(tmp_path, self.path)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lines = 0
@@ -0,0 +1,177 @@
+""" @file rename_pool.py
+    @author Sean Duffie
+    @brief Fixed-size worker pool for rename jobs.
+
+    Every job is keyed by the path it renames. While a key is queued or running, further
+    submissions for it are collapsed into the existing job, so a burst of events for the
+    same file only ever produces one rename and the thread count stays constant.
+
+    Jobs are taken in priority order, so background work (like the startup orphan scan)
+    never delays renames for recordings that just finished.
+"""
+import itertools
+import queue
+import threading
+import time
+
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = 10
+# Stop requests sort after every job, so queued work is finished first.
+_PRIORITY_STOP = 1000
+
+
+class RenamePool:
+    """ A job queue drained by a fixed number of daemon worker threads. """
+    def __init__(self, handler, workers: int=2, name: str="OBSRenamer", debug: bool=False,
+                 initializer=None):
+        """ Create the pool and start its workers.
+
+        Args:
+            handler (callable): Called with the submitted arguments on a worker thread.
+            workers (int, optional): Number of worker threads. Defaults to 2.
+            name (str, optional): Prefix for the worker thread names. Defaults to "OBSRenamer".
+            debug (bool, optional): Print progress messages. Defaults to False.
+            initializer (callable, optional): Called by each worker thread when it starts.
+        """
+        self.handler = handler
+        self.initializer = initializer
+        self.name = name
+        self.debug = debug
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._threads = []
+        # Stop requests queued by resize() that no worker has acted on yet.
+        self._pending_stops = 0
+        self._closed = False
+        self.resize(workers)
+
+    @property
+    def queue_depth(self) -> int:
+        """ Jobs waiting for a free worker. """
+        return self._queue.qsize()
+
+    @property
+    def worker_count(self) -> int:
+        """ Worker threads alive and not already asked to stop. """
+        with self._lock:
+            return self._live_locked()
+
+    @property
+    def in_flight(self) -> int:
+        """ Jobs queued or running. """
+        with self._lock:
+            return len(self._in_flight)
+
+    def submit(self, key, *args, priority: int=PRIORITY_NORMAL, on_accept=None) -> bool:
+        """ Queue a job unless one with the same key is already pending or running.
+
+        Args:
+            key (hashable): Identity of the job, normally the source file path.
+            *args: Passed to the handler.
+            priority (int, optional): Lower runs first. Defaults to PRIORITY_NORMAL.
+            on_accept (callable, optional): Called with no arguments once the job is accepted,
+                before any worker can start it. Not called for a collapsed job.
+
+        Returns:
+            bool: True if the job was queued, False if it was collapsed or the pool is closed.
+        """
+        with self._lock:
+            if self._closed or key in self._in_flight:
+                if self.debug:
+                    print("DEBUG: Rename job already queued, skipping - " + str(key))
+                return False
+            self._in_flight.add(key)
+        if on_accept is not None:
+            self._accepted(key, on_accept)
+        self._queue.put((priority, next(self._order), key, args))
+        return True
+
+    def _accepted(self, key, on_accept):
+        """ Run a submit() callback, releasing the key again if it fails. """
+        try:
+            on_accept()
+        except BaseException:
+            with self._lock:
+                self._in_flight.discard(key)
+            raise
+
+    def resize(self, workers: int):
+        """ Grow or shrink the number of worker threads.
+
+        Args:
+            workers (int): The new worker count. At least one worker is always kept.
+        """
+        workers = max(1, int(workers))
+        with self._lock:
+            if self._closed:
+                return
+            current = self._live_locked()
+            # Growing takes back stops that haven't been acted on before adding threads.
+            cancelled = min(self._pending_stops, max(workers - current, 0))
+            self._pending_stops -= cancelled
+            current += cancelled
+            started = []
+            for _ in range(current, workers):
+                thread = threading.Thread(target=self._work, name=self.name, daemon=True)
+                self._threads.append(thread)
+                started.append(thread)
+            stops = max(current - workers, 0)
+            self._pending_stops += stops
+        for thread in started:
+            thread.start()
+        for _ in range(stops):
+            self._stop_one()
+
+    def shutdown(self, timeout: float=None) -> bool:
+        """ Stop accepting jobs and wait for the queued ones to finish.
+
+        Args:
+            timeout (float, optional): Seconds to wait. None waits forever. Defaults to None.
+
+        Returns:
+            bool: True if every worker exited within the timeout.
+        """
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._stop_one()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return not any(t.is_alive() for t in threads)
+
+    def _live_locked(self) -> int:
+        """ Workers that will keep running. Lock must be held. """
+        self._threads = [t for t in self._threads if t.is_alive() or not t.ident]
+        return len(self._threads) - self._pending_stops
+
+    def _stop_one(self):
+        """ Ask one worker to exit once the queue ahead of it is empty. """
+        self._queue.put((_PRIORITY_STOP, next(self._order), None, None))
+
+    def _work(self):
+        """ Worker thread main loop. An item with no arguments tells the worker to exit,
+        unless it was a resize() stop that a later resize() took back.
+        """
+        if self.initializer is not None:
+            self.initializer()
+        while True:
+            _, _, key, args = self._queue.get()
+            if args is None:
+                with self._lock:
+                    if not self._closed:
+                        if not self._pending_stops:
+                            continue
+                        self._pending_stops -= 1
+                    self._threads.remove(threading.current_thread())
+                return
+            try:
+                self.handler(*args)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"ERROR: Rename job failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
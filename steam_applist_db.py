@@ -0,0 +1,237 @@
+""" @file steam_applist_db.py
+    @author Sean Duffie
+    @brief Offline appid -> name database for apps that are in no local Steam cache.
+
+    Built once from a Steam app-list JSON dump (GetAppList / IStoreService output saved to
+    a file), then opened read only with mmap. The file is laid out as:
+
+        header   magic (8 bytes), uint32 count, uint32 reserved
+        appids   count x uint32, sorted ascending
+        offsets  (count + 1) x uint32, start of each name in the string blob
+        blob     every name, UTF-8, back to back
+
+    All integers are little endian. Opening only maps the file and wraps the two arrays in
+    memoryviews, so it costs the same for 200 apps or 200,000. Names become Python
+    objects only when they are looked up.
+
+    Usage:
+        python steam_applist_db.py build applist.json steam_applist.db
+        python steam_applist_db.py lookup steam_applist.db 440 570
+"""
+import argparse
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"OGRAPPS1"
+_HEADER = struct.Struct("<8sII")
+
+
+def _load_dump(path: str) -> dict:
+    """ Read appid -> name from a JSON app-list dump.
+
+    Accepts {"applist": {"apps": [...]}}, {"response": {"apps": [...]}} or a bare list of
+    {"appid": ..., "name": ...} objects. Later non-empty names win over earlier ones.
+
+    Args:
+        path (str): The JSON file.
+
+    Returns:
+        dict: int appid -> str name.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = (data.get("applist") or data.get("response") or data).get("apps", [])
+        if isinstance(data, dict):
+            # Very old dumps nest once more: {"apps": {"app": [...]}}.
+            data = data.get("app", [])
+    names = {}
+    for app in data:
+        try:
+            appid = int(app["appid"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        name = str(app.get("name") or "").strip()
+        if name and 0 < appid <= 0xFFFFFFFF:
+            names[appid] = name
+    return names
+
+
+def build_database(names: dict, path: str) -> int:
+    """ Write an app-list database. The file is replaced atomically.
+
+    Args:
+        names (dict): int appid -> str name.
+        path (str): Output file.
+
+    Returns:
+        int: Number of apps written.
+    """
+    appids = array.array("I", sorted(names))
+    offsets = array.array("I", [0])
+    blob = bytearray()
+    for appid in appids:
+        blob += names[appid].encode("utf-8")
+        offsets.append(len(blob))
+    if sys.byteorder != "little":
+        appids.byteswap()
+        offsets.byteswap()
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(appids), 0))
+        f.write(appids.tobytes())
+        f.write(offsets.tobytes())
+        f.write(blob)
+    os.replace(tmp, path)
+    return len(appids)
+
+
+class AppListDB:
+    """ Read-only, memory-mapped view of a database written by build_database(). """
+    def __init__(self, path: str):
+        """ Map the database.
+
+        Args:
+            path (str): The database file.
+
+        Raises:
+            ValueError: If the file is not an app-list database.
+            OSError: If it can't be opened.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, count, _ = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an app-list database")
+            ids_start = _HEADER.size
+            offsets_start = ids_start + 4 * count
+            self._blob_start = offsets_start + 4 * (count + 1)
+            if len(self._map) < self._blob_start:
+                raise ValueError(f"{path} is truncated")
+            view = memoryview(self._map)
+            if sys.byteorder == "little":
+                self._appids = view[ids_start:offsets_start].cast("I")
+                self._offsets = view[offsets_start:self._blob_start].cast("I")
+            else:
+                self._appids = array.array("I", view[ids_start:offsets_start])
+                self._offsets = array.array("I", view[offsets_start:self._blob_start])
+                self._appids.byteswap()
+                self._offsets.byteswap()
+            self._count = count
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+
+    def close(self):
+        """ Unmap the database. """
+        if self._map is None:
+            return
+        # Views into the map must be released before it can be closed.
+        for view in (self._appids, self._offsets):
+            if isinstance(view, memoryview):
+                view.release()
+        self._appids = self._offsets = ()
+        self._map.close()
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _name_at(self, index: int) -> str:
+        """ Decode the name stored at an index. """
+        start = self._blob_start + self._offsets[index]
+        end = self._blob_start + self._offsets[index + 1]
+        return self._map[start:end].decode("utf-8", "replace")
+
+    def lookup(self, appid) -> str:
+        """ Name of one app.
+
+        Args:
+            appid (str | int): The Steam appid.
+
+        Returns:
+            str: The name, or None if the app isn't in the database.
+        """
+        try:
+            appid = int(appid)
+        except (TypeError, ValueError):
+            return None
+        index = bisect.bisect_left(self._appids, appid)
+        if index < self._count and self._appids[index] == appid:
+            return self._name_at(index)
+        return None
+
+    def lookup_many(self, appids) -> dict:
+        """ Names of many apps at once.
+
+        The ids are sorted first, so each bisect only searches the part of the index
+        after the previous hit.
+
+        Args:
+            appids (iterable): Steam appids (str or int). Invalid ones are ignored.
+
+        Returns:
+            dict: int appid -> name, for the ids that were found.
+        """
+        wanted = set()
+        for appid in appids:
+            try:
+                wanted.add(int(appid))
+            except (TypeError, ValueError):
+                continue
+        found = {}
+        low = 0
+        for appid in sorted(wanted):
+            low = bisect.bisect_left(self._appids, appid, low)
+            if low >= self._count:
+                break
+            if self._appids[low] == appid:
+                found[appid] = self._name_at(low)
+        return found
+
+
+def main(argv: list=None) -> int:
+    """ Command line entry point: build or query a database. """
+    parser = argparse.ArgumentParser(description="Offline Steam app-list database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build a database from a JSON app-list dump.")
+    build.add_argument("dump", help="App-list JSON file.")
+    build.add_argument("database", help="Database file to write.")
+    lookup = commands.add_parser("lookup", help="Look up appids in a database.")
+    lookup.add_argument("database", help="Database file to read.")
+    lookup.add_argument("appids", nargs="+", help="Steam appids.")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "build":
+            count = build_database(_load_dump(args.dump), args.database)
+            print(f"Wrote {count} apps to {args.database}")
+        else:
+            with AppListDB(args.database) as db:
+                names = db.lookup_many(args.appids)
+                for appid in args.appids:
+                    try:
+                        print(f"{appid}\t{names.get(int(appid), '')}")
+                    except ValueError:
+                        print(f"{appid}\t")
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,19 +7,1150 @@
     - [ ] Group Clips by month/year
     - [ ] Mark overlapping clips??
 """
+import array
+import bisect
+import mmap
+import os
+import re
+import struct
 import sys
+import threading
+import time
+import zlib
+
+import linux_inotify
+import proc_scanner
 
 if sys.platform == 'win32':
     import winreg
-elif sys.platform == 'linux' or sys.platform == 'linux2':
-    import os
-    import re
+
+REGISTRY_PATH = os.path.expanduser("~/.steam/registry.vdf")
+RUNNING_APPID_PATH = ("Registry", "HKCU", "Software", "Valve", "Steam", "RunningAppID")
+
+# Text KeyValues tokens: comments, quoted strings, braces, [$CONDITIONALS] and bare words.
+_VDF_TOKEN_RE = re.compile(
+    r'\s*(?:(//[^\n]*(?:\n|$))|"((?:[^"\\]|\\.)*)"|([{}])|(\[[^\]\n]*\])|([^\s{}"]+))', re.S)
+_VDF_ESCAPES = {"n": "\n", "t": "\t", "\\": "\\", '"': '"'}
+_VDF_ESCAPE_RE = re.compile(r"\\(.)")
+VDF_CHUNK_SIZE = 64 * 1024
+
+# Markers yielded by iter_vdf() for the start and end of a section.
+SECTION_START = object()
+SECTION_END = object()
+
+# registry.vdf parse results keyed by path. Each entry is ((mtime_ns, size, inode), result).
+_registry_cache = {}
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _vdf_unescape(text: str) -> str:
+    """ Undo KeyValues string escapes (\\n, \\t, \\\\ and \\"). """
+    if "\\" not in text:
+        return text
+    return _VDF_ESCAPE_RE.sub(lambda m: _VDF_ESCAPES.get(m.group(1), "\\" + m.group(1)), text)
+
+
+class _Brace(str):
+    """ Distinct type for brace tokens, so a quoted "{" is still a plain string. """
+
+OPEN_BRACE = _Brace("{")
+CLOSE_BRACE = _Brace("}")
+
+
+def iter_vdf_tokens(stream, chunk_size: int=VDF_CHUNK_SIZE):
+    """ Tokenize a text KeyValues stream incrementally.
+
+    The stream is read one chunk at a time, so a caller that stops early never reads
+    the rest of the file. Comments and [$PLATFORM] conditionals are dropped.
+
+    Args:
+        stream (file): A text-mode file object.
+        chunk_size (int, optional): Characters to read at a time.
+
+    Yields:
+        str: "{" or "}" for braces, otherwise a (key or value) string. Braces are yielded
+            as the identical objects OPEN_BRACE and CLOSE_BRACE, so quoted "{" strings
+            can be told apart with an identity check.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+    while True:
+        match = _VDF_TOKEN_RE.match(buf, pos)
+        # A token touching the end of the buffer may continue in the next chunk.
+        if (match is None or match.end() == len(buf)) and not eof:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if match is None:
+            if buf[pos:].strip():
+                raise ValueError("Malformed KeyValues text near: " + buf[pos:pos + 40])
+            return
+        pos = match.end()
+        comment, quoted, brace, _, bare = match.groups()
+        if comment is not None:
+            continue
+        if quoted is not None:
+            yield _vdf_unescape(quoted)
+        elif brace is not None:
+            yield OPEN_BRACE if brace == "{" else CLOSE_BRACE
+        elif bare is not None:
+            yield bare
+
+
+def iter_vdf(stream, chunk_size: int=VDF_CHUNK_SIZE):
+    """ Walk a text KeyValues stream as a flat series of events.
+
+    Args:
+        stream (file): A text-mode file object.
+        chunk_size (int, optional): Characters to read at a time.
+
+    Yields:
+        tuple: (path, value). path is the tuple of keys leading to the entry. value is the
+            string for a key/value pair, or SECTION_START / SECTION_END for a section.
+    """
+    path = []
+    key = None
+    for token in iter_vdf_tokens(stream, chunk_size):
+        if token is OPEN_BRACE:
+            if key is None:
+                raise ValueError("KeyValues section without a name")
+            path.append(key)
+            yield tuple(path), SECTION_START
+            key = None
+        elif token is CLOSE_BRACE:
+            if not path:
+                raise ValueError("Unbalanced '}' in KeyValues text")
+            yield tuple(path), SECTION_END
+            path.pop()
+            key = None
+        elif key is None:
+            key = token
+        else:
+            yield tuple(path) + (key,), token
+            key = None
+
+
+def _open_vdf(source):
+    """ Open a path for iter_vdf(), or pass a file object through. """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        return open(source, "r", encoding="utf-8", errors="replace")
+    return None
+
+
+def parse_vdf(source) -> dict:
+    """ Parse a whole text KeyValues file into nested dicts.
+
+    Works for registry.vdf, libraryfolders.vdf, appmanifest_*.acf, loginusers.vdf and
+    any other Steam text KeyValues file. Repeated keys keep the last value.
+
+    Args:
+        source (str | file): A path or a text-mode file object.
+
+    Returns:
+        dict: Sections are dicts, values are strings.
+    """
+    stream = _open_vdf(source)
+    try:
+        root = {}
+        stack = [root]
+        for path, value in iter_vdf(stream or source):
+            if value is SECTION_START:
+                section = {}
+                stack[-1][path[-1]] = section
+                stack.append(section)
+            elif value is SECTION_END:
+                stack.pop()
+            else:
+                stack[-1][path[-1]] = value
+        return root
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def find_vdf_keys(source, key_paths) -> dict:
+    """ Stream a text KeyValues file and stop as soon as the wanted values are found.
+
+    Keys are matched case-insensitively, like Steam does.
+
+    Args:
+        source (str | file): A path or a text-mode file object.
+        key_paths (iterable): Tuples of keys, e.g. RUNNING_APPID_PATH.
+
+    Returns:
+        dict: Each requested key path (as given) mapped to its value. Missing ones are absent.
+    """
+    wanted = {tuple(k.lower() for k in key_path): tuple(key_path) for key_path in key_paths}
+    found = {}
+    stream = _open_vdf(source)
+    try:
+        for path, value in iter_vdf(stream or source):
+            if value is SECTION_START or value is SECTION_END:
+                continue
+            key_path = wanted.get(tuple(k.lower() for k in path))
+            if key_path is not None:
+                found[key_path] = value
+                if len(found) == len(wanted):
+                    break
+        return found
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def vdf_get(data: dict, *keys, default=None):
+    """ Case-insensitive lookup through nested dicts from parse_vdf().
+
+    Args:
+        data (dict): Parsed KeyValues.
+        *keys (str): The keys to follow.
+        default (optional): Returned when a key is missing. Defaults to None.
+
+    Returns:
+        The value found, or default.
+    """
+    node = data
+    for key in keys:
+        if not isinstance(node, dict):
+            return default
+        if key in node:
+            node = node[key]
+            continue
+        lowered = key.lower()
+        for name, value in node.items():
+            if name.lower() == lowered:
+                node = value
+                break
+        else:
+            return default
+    return node
+
+
+def cache_info() -> dict:
+    """ Hit/miss counters for the registry.vdf parse cache.
+
+    Returns:
+        dict: {"hits": int, "misses": int, "entries": int}
+    """
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_registry_cache))
+
+
+def clear_cache():
+    """ Forget every cached parse and reset the counters. """
+    with _cache_lock:
+        _registry_cache.clear()
+        _cache_stats["hits"] = 0
+        _cache_stats["misses"] = 0
+
+
+def read_running_appid(path: str=REGISTRY_PATH) -> str:
+    """ Get RunningAppID from a registry.vdf, re-reading it only when it has changed.
+
+    Steam rewrites the file rarely, so repeated calls normally cost a single stat().
+
+    Args:
+        path (str, optional): The registry file. Defaults to ~/.steam/registry.vdf.
+
+    Returns:
+        str: The running appid, or None if no game is running.
+
+    Raises:
+        FileNotFoundError: If the registry file does not exist.
+    """
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _cache_lock:
+        cached = _registry_cache.get(path)
+        if cached is not None and cached[0] == key:
+            _cache_stats["hits"] += 1
+            return cached[1]
+        _cache_stats["misses"] += 1
+
+    result = find_vdf_keys(path, [RUNNING_APPID_PATH]).get(RUNNING_APPID_PATH)
+
+    with _cache_lock:
+        _registry_cache[path] = (key, result)
+    return result
+
+# Where Steam keeps its data on Linux: native, Debian/Ubuntu symlinks and Flatpak.
+STEAM_ROOTS = (
+    "~/.steam/steam",
+    "~/.steam/root",
+    "~/.local/share/Steam",
+    "~/.var/app/com.valvesoftware.Steam/.local/share/Steam",
+    "~/.var/app/com.valvesoftware.Steam/data/Steam",
+)
+MANIFEST_APPID_PATH = ("AppState", "appid")
+MANIFEST_NAME_PATH = ("AppState", "name")
+# Minimum seconds between refreshes triggered by lookups of unknown appids.
+INDEX_REFRESH_INTERVAL = 2.0
+
+
+def steam_roots() -> list:
+    """ Existing Steam installation directories, with symlinked duplicates removed.
+
+    Returns:
+        list: Real paths of the Steam roots.
+    """
+    roots = []
+    for root in STEAM_ROOTS:
+        real = os.path.realpath(os.path.expanduser(root))
+        if real not in roots and os.path.isdir(real):
+            roots.append(real)
+    return roots
+
+
+class AppManifestIndex:
+    """ appid -> name map built from every library's steamapps/appmanifest_*.acf.
+
+    Each steamapps directory is only re-listed when its mtime changes (Steam writes
+    manifests through a rename, which always touches the directory), and each manifest
+    is only re-parsed when its own mtime changes. Lookups are a single dict access.
+    """
+    def __init__(self, roots: list=None):
+        """ Create an empty index. It fills itself on the first lookup.
+
+        Args:
+            roots (list, optional): Steam roots to index. Defaults to steam_roots().
+        """
+        self._roots = roots
+        self._lock = threading.Lock()
+        # libraryfolders.vdf path -> (mtime_ns, [steamapps dirs])
+        self._library_files = {}
+        # steamapps dir -> (mtime_ns, {manifest name: (mtime_ns, appid, name)})
+        self._libraries = {}
+        self._names = {}
+        self._last_refresh = None
+
+    def libraries(self) -> list:
+        """ Every steamapps directory listed by the Steam roots' libraryfolders.vdf.
+
+        Returns:
+            list: Real paths of the steamapps directories.
+        """
+        dirs = []
+        for root in (self._roots if self._roots is not None else steam_roots()):
+            own = os.path.join(root, "steamapps")
+            if own not in dirs:
+                dirs.append(own)
+            for vdf in (os.path.join(root, "steamapps", "libraryfolders.vdf"),
+                        os.path.join(root, "config", "libraryfolders.vdf")):
+                for steamapps in self._library_file(vdf):
+                    if steamapps not in dirs:
+                        dirs.append(steamapps)
+        return dirs
+
+    def _library_file(self, path: str) -> list:
+        """ steamapps directories from one libraryfolders.vdf, cached by mtime. """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
+        cached = self._library_files.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            data = parse_vdf(path)
+        except (OSError, ValueError):
+            return []
+        dirs = []
+        folders = vdf_get(data, "libraryfolders") or vdf_get(data, "LibraryFolders") or {}
+        for value in folders.values():
+            # Old format: "1" "/path". New format: "1" { "path" "/path" ... }.
+            folder = vdf_get(value, "path") if isinstance(value, dict) else value
+            if folder and os.path.isabs(folder):
+                dirs.append(os.path.realpath(os.path.join(folder, "steamapps")))
+        self._library_files[path] = (mtime, dirs)
+        return dirs
+
+    def refresh(self):
+        """ Bring the index up to date, touching only libraries whose directory changed. """
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            changed = False
+            current = self.libraries()
+            for steamapps in list(self._libraries):
+                if steamapps not in current:
+                    del self._libraries[steamapps]
+                    changed = True
+            for steamapps in current:
+                changed |= self._refresh_library(steamapps)
+            if changed:
+                names = {}
+                for _, manifests in self._libraries.values():
+                    for _, appid, name in manifests.values():
+                        names[appid] = name
+                self._names = names
+
+    def _refresh_library(self, steamapps: str) -> bool:
+        """ Re-list one steamapps directory if its mtime moved. Lock must be held.
+
+        Returns:
+            bool: True if the library's manifests changed.
+        """
+        try:
+            mtime = os.stat(steamapps).st_mtime_ns
+        except OSError:
+            return self._libraries.pop(steamapps, None) is not None
+        cached = self._libraries.get(steamapps)
+        if cached is not None and cached[0] == mtime:
+            return False
+
+        old = cached[1] if cached is not None else {}
+        manifests = {}
+        try:
+            with os.scandir(steamapps) as entries:
+                for entry in entries:
+                    if not (entry.name.startswith("appmanifest_") and entry.name.endswith(".acf")):
+                        continue
+                    try:
+                        entry_mtime = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+                    previous = old.get(entry.name)
+                    if previous is not None and previous[0] == entry_mtime:
+                        manifests[entry.name] = previous
+                        continue
+                    parsed = self._parse_manifest(entry.path)
+                    if parsed is not None:
+                        manifests[entry.name] = (entry_mtime,) + parsed
+        except OSError:
+            return False
+        self._libraries[steamapps] = (mtime, manifests)
+        return True
+
+    @staticmethod
+    def _parse_manifest(path: str) -> tuple:
+        """ (appid, name) from one appmanifest, or None if it can't be read. """
+        try:
+            found = find_vdf_keys(path, [MANIFEST_APPID_PATH, MANIFEST_NAME_PATH])
+        except (OSError, ValueError):
+            return None
+        appid = found.get(MANIFEST_APPID_PATH)
+        name = found.get(MANIFEST_NAME_PATH)
+        if not appid or not name:
+            return None
+        return str(appid), name
+
+    def lookup(self, appid) -> str:
+        """ Name of an installed app.
+
+        Args:
+            appid (str | int): The Steam appid.
+
+        Returns:
+            str: The app's name, or None if it isn't installed in any library.
+        """
+        appid = str(appid)
+        name = self._names.get(appid)
+        if name is None:
+            last = self._last_refresh
+            if last is None or time.monotonic() - last >= INDEX_REFRESH_INTERVAL:
+                self.refresh()
+                name = self._names.get(appid)
+        return name
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+_manifest_index = AppManifestIndex()
+
+
+def lookup_app_name(appid) -> str:
+    """ Resolve a Steam appid to a name using the installed apps' manifests.
+
+    Args:
+        appid (str | int): The Steam appid.
+
+    Returns:
+        str: The app's name, or None if unknown.
+    """
+    return _manifest_index.lookup(appid)
+
+
+# Binary KeyValues value types, shared by appinfo.vdf and shortcuts.vdf.
+BKV_SECTION = 0x00
+BKV_STRING = 0x01
+BKV_INT32 = 0x02
+BKV_FLOAT32 = 0x03
+BKV_POINTER = 0x04
+BKV_WSTRING = 0x05
+BKV_COLOR = 0x06
+BKV_UINT64 = 0x07
+BKV_END = 0x08
+BKV_INT64 = 0x0A
+BKV_END_ALT = 0x0B
+_BKV_FIXED_SIZES = {BKV_INT32: 4, BKV_FLOAT32: 4, BKV_POINTER: 4, BKV_COLOR: 4,
+                    BKV_UINT64: 8, BKV_INT64: 8}
+_BKV_NUMBERS = {BKV_INT32: "<i", BKV_FLOAT32: "<f", BKV_POINTER: "<i", BKV_COLOR: "<i",
+                BKV_UINT64: "<Q", BKV_INT64: "<q"}
+
+APPINFO_MAGIC_V27 = 0x07564427
+APPINFO_MAGIC_V28 = 0x07564428
+APPINFO_MAGIC_V29 = 0x07564429
+# Bytes between an entry's size field and its KeyValues data:
+# info_state, last_updated, pics_token, text sha1, change_number (+ binary sha1 from v28).
+_APPINFO_ENTRY_HEADER = {APPINFO_MAGIC_V27: 40, APPINFO_MAGIC_V28: 60, APPINFO_MAGIC_V29: 60}
+
+
+def _bkv_cstring(buf, pos: int) -> tuple:
+    """ Read a null-terminated string. Returns (bytes, position after the terminator). """
+    end = buf.find(b"\0", pos)
+    if end < 0:
+        raise ValueError("Unterminated string in binary KeyValues")
+    return buf[pos:end], end + 1
+
+
+def _bkv_skip(buf, pos: int, value_type: int, read_key) -> int:
+    """ Skip over one value without decoding it. Returns the position after it. """
+    if value_type == BKV_SECTION:
+        while True:
+            value_type = buf[pos]
+            pos += 1
+            if value_type in (BKV_END, BKV_END_ALT):
+                return pos
+            _, pos = read_key(buf, pos)
+            pos = _bkv_skip(buf, pos, value_type, read_key)
+    if value_type == BKV_STRING:
+        return _bkv_cstring(buf, pos)[1]
+    if value_type == BKV_WSTRING:
+        while buf[pos:pos + 2] != b"\0\0":
+            pos += 2
+        return pos + 2
+    size = _BKV_FIXED_SIZES.get(value_type)
+    if size is None:
+        raise ValueError(f"Unknown binary KeyValues type 0x{value_type:02x}")
+    return pos + size
+
+
+def _bkv_value(buf, pos: int, value_type: int, read_key, decode_key) -> tuple:
+    """ Decode one value. Returns (value, position after it). """
+    if value_type == BKV_SECTION:
+        section = {}
+        while True:
+            value_type = buf[pos]
+            pos += 1
+            if value_type in (BKV_END, BKV_END_ALT):
+                return section, pos
+            key, pos = read_key(buf, pos)
+            section[decode_key(key)], pos = _bkv_value(buf, pos, value_type, read_key, decode_key)
+    if value_type == BKV_STRING:
+        raw, pos = _bkv_cstring(buf, pos)
+        return bytes(raw).decode("utf-8", "replace"), pos
+    if value_type == BKV_WSTRING:
+        end = pos
+        while buf[end:end + 2] != b"\0\0":
+            end += 2
+        return bytes(buf[pos:end]).decode("utf-16-le", "replace"), end + 2
+    fmt = _BKV_NUMBERS.get(value_type)
+    if fmt is None:
+        raise ValueError(f"Unknown binary KeyValues type 0x{value_type:02x}")
+    return struct.unpack_from(fmt, buf, pos)[0], pos + _BKV_FIXED_SIZES[value_type]
+
+
+def _bkv_find(buf, pos: int, keys: list, read_key):
+    """ Follow keys (raw key values, as read_key returns them) from the start of a section.
+
+    Only the values on the path are looked at, everything else is skipped.
+
+    Returns:
+        tuple: (value type, position of the value) or None if the path doesn't exist.
+    """
+    for depth, wanted in enumerate(keys):
+        while True:
+            value_type = buf[pos]
+            pos += 1
+            if value_type in (BKV_END, BKV_END_ALT):
+                return None
+            key, pos = read_key(buf, pos)
+            if key == wanted:
+                if depth == len(keys) - 1:
+                    return value_type, pos
+                if value_type != BKV_SECTION:
+                    return None
+                break
+            pos = _bkv_skip(buf, pos, value_type, read_key)
+    return None
+
+
+def parse_binary_vdf(buf, pos: int=0) -> dict:
+    """ Decode binary KeyValues with inline string keys (the shortcuts.vdf flavor).
+
+    Args:
+        buf (bytes | mmap): The data.
+        pos (int, optional): Offset of the first entry. Defaults to 0.
+
+    Returns:
+        dict: Sections are dicts, values are str, int or float.
+    """
+    return _bkv_value(buf, pos, BKV_SECTION, _bkv_cstring,
+                      lambda key: bytes(key).decode("utf-8", "replace"))[0]
+
+
+class AppInfoReader:
+    """ Names of any app from Steam's binary appcache/appinfo.vdf.
+
+    The file is memory mapped and only an offset index (two parallel arrays of appids
+    and data offsets) is built up front. An app's KeyValues are decoded only when its
+    name is asked for, and only far enough to reach appinfo/common/name.
+    """
+    def __init__(self, path: str):
+        """ Create a reader. The file is opened on the first lookup.
+
+        Args:
+            path (str): Path to appinfo.vdf.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._key = None
+        self._file = None
+        self._map = None
+        self._appids = array.array("I")
+        self._offsets = array.array("Q")
+        self._names = {}
+        self._read_key = None
+        self._path_keys = None
+
+    def _open(self) -> bool:
+        """ (Re)map the file and rebuild the index if it changed. Lock must be held. """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._close()
+            return False
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if key == self._key:
+            return self._map is not None
+        self._close()
+        self._key = key
+        try:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._build_index()
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            print(f"ERROR: Could not read {self.path}: {e}")
+            self._close()
+            return False
+        return True
+
+    def _build_index(self):
+        """ Walk the entry headers and record where each app's KeyValues start. """
+        buf = self._map
+        magic, _ = struct.unpack_from("<II", buf, 0)
+        header = _APPINFO_ENTRY_HEADER.get(magic)
+        if header is None:
+            raise ValueError(f"unsupported appinfo.vdf version 0x{magic:08x}")
+
+        pos = 8
+        if magic >= APPINFO_MAGIC_V29:
+            # Keys are indices into a string table at the end of the file.
+            table_offset = struct.unpack_from("<q", buf, pos)[0]
+            pos += 8
+            strings = self._string_table(table_offset)
+            self._read_key = lambda b, p: (struct.unpack_from("<I", b, p)[0], p + 4)
+            wanted = (b"appinfo", b"common", b"name")
+            self._path_keys = [strings.get(k) for k in wanted]
+        else:
+            self._read_key = _bkv_cstring
+            self._path_keys = [b"appinfo", b"common", b"name"]
+
+        appids = array.array("I")
+        offsets = array.array("Q")
+        end = len(buf)
+        while pos + 8 <= end:
+            appid, size = struct.unpack_from("<II", buf, pos)
+            if appid == 0:
+                break
+            appids.append(appid)
+            offsets.append(pos + 8 + header)
+            pos += 8 + size
+        # Entries are stored in appid order, but don't rely on it for bisect.
+        if any(appids[i] > appids[i + 1] for i in range(len(appids) - 1)):
+            order = sorted(range(len(appids)), key=appids.__getitem__)
+            appids = array.array("I", (appids[i] for i in order))
+            offsets = array.array("Q", (offsets[i] for i in order))
+        self._appids = appids
+        self._offsets = offsets
+
+    def _string_table(self, offset: int) -> dict:
+        """ Map the key strings we need to their index in a v29 string table. """
+        buf = self._map
+        count = struct.unpack_from("<I", buf, offset)[0]
+        pos = offset + 4
+        wanted = {b"appinfo", b"common", b"name"}
+        found = {}
+        for index in range(count):
+            raw, pos = _bkv_cstring(buf, pos)
+            if raw in wanted:
+                found[bytes(raw)] = index
+                if len(found) == len(wanted):
+                    break
+        return found
+
+    def _close(self):
+        """ Drop the mapping and everything derived from it. Lock must be held. """
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._map = None
+        self._file = None
+        self._key = None
+        self._appids = array.array("I")
+        self._offsets = array.array("Q")
+        self._names = {}
+
+    def close(self):
+        """ Unmap the file. The next lookup maps it again. """
+        with self._lock:
+            self._close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._open()
+            return len(self._appids)
+
+    def name(self, appid) -> str:
+        """ Look up the name of any app Steam has seen.
+
+        Args:
+            appid (str | int): The Steam appid.
+
+        Returns:
+            str: The app's common/name, or None if it isn't in appinfo.vdf.
+        """
+        try:
+            appid = int(appid)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            if not self._open():
+                return None
+            if appid in self._names:
+                return self._names[appid]
+            index = bisect.bisect_left(self._appids, appid)
+            if index >= len(self._appids) or self._appids[index] != appid:
+                return None
+            name = None
+            if None not in self._path_keys:
+                try:
+                    found = _bkv_find(self._map, self._offsets[index], self._path_keys,
+                                      self._read_key)
+                    if found is not None and found[0] == BKV_STRING:
+                        name = _bkv_value(self._map, found[1], BKV_STRING, self._read_key,
+                                          None)[0]
+                except (ValueError, struct.error, IndexError):
+                    name = None
+            self._names[appid] = name
+            return name
+
+_appinfo_readers = {}
+
+
+def appinfo_paths() -> list:
+    """ appinfo.vdf files of the local Steam installations. """
+    return [os.path.join(root, "appcache", "appinfo.vdf") for root in steam_roots()]
+
+
+def lookup_appinfo_name(appid) -> str:
+    """ Resolve a Steam appid to a name using appcache/appinfo.vdf.
+
+    Args:
+        appid (str | int): The Steam appid.
+
+    Returns:
+        str: The app's name, or None if unknown.
+    """
+    for path in appinfo_paths():
+        reader = _appinfo_readers.get(path)
+        if reader is None:
+            reader = _appinfo_readers.setdefault(path, AppInfoReader(path))
+        name = reader.name(appid)
+        if name:
+            return name
+    return None
+
+
+# Non-Steam shortcuts are launched with the 32-bit id below; the 64-bit game id
+# (shortcut id << 32 | SHORTCUT_GAMEID_TYPE) shows up in URLs and some launchers.
+SHORTCUT_ID_FLAG = 0x80000000
+SHORTCUT_GAMEID_TYPE = 0x02000000
+
+
+def shortcut_appid(exe: str, app_name: str) -> int:
+    """ The id Steam derives for a shortcut that has no stored appid.
+
+    Args:
+        exe (str): The shortcut's Exe field, quotes included.
+        app_name (str): The shortcut's AppName field.
+
+    Returns:
+        int: The unsigned 32-bit shortcut appid.
+    """
+    return (zlib.crc32((exe + app_name).encode("utf-8")) & 0xFFFFFFFF) | SHORTCUT_ID_FLAG
+
+
+def shortcut_gameid(appid: int) -> int:
+    """ The 64-bit game id for a 32-bit shortcut appid. """
+    return (appid << 32) | SHORTCUT_GAMEID_TYPE
+
+
+def _field(entry: dict, name: str):
+    """ Case-insensitive field lookup; Steam has used both "AppName" and "appname". """
+    for key, value in entry.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_shortcuts(path: str) -> dict:
+    """ Map every id of every shortcut in one shortcuts.vdf to its name.
+
+    Args:
+        path (str): Path to a userdata/<user>/config/shortcuts.vdf.
+
+    Returns:
+        dict: int id (stored appid, derived appid and their 64-bit game ids) -> name.
+    """
+    with open(path, "rb") as f:
+        data = parse_binary_vdf(f.read())
+    names = {}
+    for entry in (_field(data, "shortcuts") or {}).values():
+        if not isinstance(entry, dict):
+            continue
+        name = _field(entry, "appname")
+        if not name:
+            continue
+        ids = {shortcut_appid(_field(entry, "exe") or "", name)}
+        stored = _field(entry, "appid")
+        if isinstance(stored, int) and stored:
+            ids.add(stored & 0xFFFFFFFF)
+        for appid in ids:
+            names[appid] = name
+            names[shortcut_gameid(appid)] = name
+    return names
+
+
+class ShortcutIndex:
+    """ id -> name map of the non-Steam shortcuts of every local Steam user.
+
+    Each shortcuts.vdf is only re-parsed when its mtime or size changes, and the
+    userdata directories are re-listed at most every INDEX_REFRESH_INTERVAL seconds.
+    """
+    def __init__(self, roots: list=None):
+        """ Create an empty index. It fills itself on the first lookup.
+
+        Args:
+            roots (list, optional): Steam roots to index. Defaults to steam_roots().
+        """
+        self._roots = roots
+        self._lock = threading.Lock()
+        # shortcuts.vdf path -> ((mtime_ns, size), {id: name})
+        self._files = {}
+        self._names = {}
+        self._last_refresh = None
+
+    def paths(self) -> list:
+        """ shortcuts.vdf of every user under every Steam root. """
+        paths = []
+        for root in (self._roots if self._roots is not None else steam_roots()):
+            userdata = os.path.join(root, "userdata")
+            try:
+                with os.scandir(userdata) as entries:
+                    users = [entry.name for entry in entries if entry.name.isdigit()]
+            except OSError:
+                continue
+            for user in users:
+                paths.append(os.path.join(userdata, user, "config", "shortcuts.vdf"))
+        return paths
+
+    def refresh(self):
+        """ Re-parse the shortcuts.vdf files that changed since the last refresh. """
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            changed = False
+            files = {}
+            for path in self.paths():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                key = (st.st_mtime_ns, st.st_size)
+                cached = self._files.get(path)
+                if cached is not None and cached[0] == key:
+                    files[path] = cached
+                    continue
+                try:
+                    files[path] = (key, parse_shortcuts(path))
+                except (OSError, ValueError, struct.error, IndexError) as e:
+                    print(f"ERROR: Could not read {path}: {e}")
+                    continue
+                changed = True
+            if changed or files.keys() != self._files.keys():
+                names = {}
+                for _, shortcuts in files.values():
+                    names.update(shortcuts)
+                self._names = names
+            self._files = files
+
+    def lookup(self, appid) -> str:
+        """ Name of a non-Steam shortcut.
+
+        Args:
+            appid (str | int): The 32-bit shortcut appid or 64-bit game id.
+
+        Returns:
+            str: The shortcut's AppName, or None if no local user has it.
+        """
+        try:
+            appid = int(appid)
+        except (TypeError, ValueError):
+            return None
+        # Some places store the 32-bit id signed.
+        if appid < 0:
+            appid &= 0xFFFFFFFF
+        name = self._names.get(appid)
+        if name is None:
+            last = self._last_refresh
+            if last is None or time.monotonic() - last >= INDEX_REFRESH_INTERVAL:
+                self.refresh()
+                name = self._names.get(appid)
+        return name
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+_shortcut_index = ShortcutIndex()
+
+
+def lookup_shortcut_name(appid) -> str:
+    """ Resolve a non-Steam shortcut id to the name it was added to Steam with.
+
+    Args:
+        appid (str | int): The shortcut appid or game id.
+
+    Returns:
+        str: The shortcut's name, or None if unknown.
+    """
+    return _shortcut_index.lookup(appid)
+
+
+def lookup_any_name(appid) -> str:
+    """ Resolve any id Steam reports as running, cheapest source first.
+
+    Args:
+        appid (str | int): A Steam appid, shortcut appid or game id.
+
+    Returns:
+        str: The name, or None if unknown.
+    """
+    return lookup_app_name(appid) or lookup_shortcut_name(appid) or lookup_appinfo_name(appid)
+
+
+_proc_scanner = proc_scanner.ProcGameScanner() if proc_scanner.available() else None
+
+
+def get_running_proc_game() -> str:
+    """ The appid of the running game according to the process table.
+
+    Returns:
+        str: The appid, or None if no Steam-launched game is running or /proc is unavailable.
+    """
+    if _proc_scanner is None:
+        return None
+    return _proc_scanner.running_appid()
+
+
+def get_running_proc_process() -> tuple:
+    """ The newest process Steam launched a game in.
+
+    Returns:
+        tuple: (pid, starttime, appid), or None if there is none or /proc is unavailable.
+    """
+    if _proc_scanner is None:
+        return None
+    return _proc_scanner.running()
+
+
+def get_registry_game() -> tuple:
+    """ The game registry.vdf says is running, from the watcher if it is running.
+
+    Returns:
+        tuple: (appid, name). Both None if no game is running.
+    """
+    watcher = _registry_watcher
+    if watcher is not None and watcher.running:
+        return watcher.current
+    try:
+        appid = read_running_appid()
+    except (OSError, ValueError):
+        return None, None
+    if not appid or appid == "0":
+        return None, None
+    return appid, lookup_any_name(appid)
+
+
+WATCH_MASK = (linux_inotify.IN_CLOSE_WRITE | linux_inotify.IN_MOVED_TO | linux_inotify.IN_CREATE
+              | linux_inotify.IN_MODIFY | linux_inotify.IN_DELETE | linux_inotify.IN_ONLYDIR)
+# How often the watcher thread checks for stop(), and polls when inotify is unavailable.
+WATCH_INTERVAL = 1.0
+
+
+class RegistryWatcher:
+    """ Publishes game start/stop from registry.vdf changes instead of being polled.
+
+    The registry file's directory is watched with inotify (the file itself may be
+    replaced by a rename, which a watch on the file would not survive). The file is only
+    re-parsed when an event names it. Where inotify is unavailable, the cached
+    read_running_appid() is polled instead.
+
+    The current state is a single tuple swapped atomically, so readers never lock.
+    Callbacks run on the watcher thread and must not block.
+    """
+    def __init__(self, path: str=REGISTRY_PATH, on_start=None, on_stop=None,
+                 debug: bool=False):
+        """ Create a watcher. Call start() to begin watching.
+
+        Args:
+            path (str, optional): The registry file. Defaults to ~/.steam/registry.vdf.
+            on_start (callable, optional): Called with (appid, name) when a game starts.
+            on_stop (callable, optional): Called with (appid, name) when a game stops.
+            debug (bool, optional): Print game changes. Defaults to False.
+        """
+        self.path = path
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.debug = debug
+        self.current = (None, None)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """ True while the watcher thread is alive. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Read the current state and start the watcher thread. """
+        if self.running:
+            return
+        self._stop.clear()
+        self._update()
+        self._thread = threading.Thread(target=self._run, name="OBSRenamerSteamWatch",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float=None):
+        """ Stop the watcher thread.
+
+        Args:
+            timeout (float, optional): Seconds to wait for it. Defaults to None.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _update(self):
+        """ Re-read RunningAppID and publish a change, if there is one. """
+        try:
+            appid = read_running_appid(self.path)
+        except (OSError, ValueError):
+            appid = None
+        if appid == "0":
+            appid = None
+        old = self.current
+        if appid == old[0]:
+            return
+        new = (appid, lookup_any_name(appid)) if appid else (None, None)
+        self.current = new
+        if old[0] is not None:
+            if self.debug:
+                print("DEBUG: Steam game stopped - " + str(old[1] or old[0]))
+            self._notify(self.on_stop, old)
+        if new[0] is not None:
+            if self.debug:
+                print("DEBUG: Steam game started - " + str(new[1] or new[0]))
+            self._notify(self.on_start, new)
+
+    @staticmethod
+    def _notify(callback, state: tuple):
+        """ Run a callback without letting it kill the watcher. """
+        if callback is None:
+            return
+        try:
+            callback(*state)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"ERROR: Steam watcher callback failed: {e}")
+
+    def _run(self):
+        """ Watcher thread main loop. """
+        if linux_inotify.available():
+            try:
+                self._watch()
+                return
+            except OSError as e:
+                if self.debug:
+                    print(f"DEBUG: inotify unavailable ({e}), polling registry.vdf instead.")
+        while not self._stop.wait(WATCH_INTERVAL):
+            self._update()
+
+    def _watch(self):
+        """ inotify loop. Raises OSError if the directory can't be watched. """
+        name = os.path.basename(self.path)
+        with linux_inotify.Inotify() as notify:
+            notify.add_watch(os.path.dirname(self.path) or ".", WATCH_MASK)
+            # The file may have changed between start() and the watch being armed.
+            self._update()
+            while not self._stop.is_set():
+                events = notify.read_events(WATCH_INTERVAL)
+                if any(event[1] & linux_inotify.IN_Q_OVERFLOW or event[3] == name
+                       for event in events):
+                    self._update()
+
+_registry_watcher = None
+
+
+def start_registry_watcher(on_start=None, on_stop=None, debug: bool=False) -> RegistryWatcher:
+    """ Start the shared registry.vdf watcher that get_running_steam_game() reads from.
+
+    Args:
+        on_start (callable, optional): Called with (appid, name) when a game starts.
+        on_stop (callable, optional): Called with (appid, name) when a game stops.
+        debug (bool, optional): Print game changes. Defaults to False.
+
+    Returns:
+        RegistryWatcher: The running watcher.
+    """
+    global _registry_watcher  # pylint: disable=global-statement
+    stop_registry_watcher()
+    _registry_watcher = RegistryWatcher(on_start=on_start, on_stop=on_stop, debug=debug)
+    _registry_watcher.start()
+    return _registry_watcher
+
+
+def stop_registry_watcher(timeout: float=None):
+    """ Stop the shared registry.vdf watcher, if one is running.
+
+    Args:
+        timeout (float, optional): Seconds to wait for its thread. Defaults to None.
+    """
+    global _registry_watcher  # pylint: disable=global-statement
+    watcher, _registry_watcher = _registry_watcher, None
+    if watcher is not None:
+        watcher.stop(timeout)
+
 
 def get_running_steam_game():
-    """ Returns the process id of the currently running steam game.
+    """ Returns the appid and name of the currently running steam game.
 
     Returns:
-        _type_: _description_
+        tuple: (appid, name). Both None if no game is running. The name is None if the
+            game is running but could not be resolved.
     """
     if sys.platform == 'win32':
         try:
@@ -50,14 +1181,23 @@ def get_running_steam_game():
             return None, None
     elif sys.platform == 'linux' or sys.platform == 'linux2':
         try:
-            with open(os.path.expanduser("~/.steam/registry.vdf"), 'r', encoding="utf-8") as f:
-                content = f.read()
-                match = re.search(r'"RunningAppID"\s+"(\d+)"', content)
-                if match:
-                    return match.group(1), "TODO"
-                else:
-                    return None, None
+            # registry.vdf often lags behind, especially under Proton; the process table doesn't.
+            game_id = get_running_proc_game()
+            watcher = _registry_watcher
+            if not game_id and watcher is not None and watcher.running:
+                return watcher.current
+            game_id = game_id or read_running_appid()
+            # Steam writes "0" when nothing is running.
+            if game_id and game_id != "0":
+                return game_id, lookup_any_name(game_id)
+            else:
+                return None, None
         except FileNotFoundError:
+            # No Steam, or only the Flatpak one. Not an error.
+            return None, None
+        except (OSError, ValueError) as e:
+            # Steam rewrites its files while running, a torn read is as good as no game.
+            print(f"ERROR: {e}")
             return None, None
     else:
         return None, None
@@ -0,0 +1,164 @@
+""" @file twitch_client.py
+    @author Sean Duffie
+    @brief Fast stream title and game lookups for the Twitch rename mode.
+
+    The title and game are two requests to the same host. Connections are kept alive in
+    a small pool, so after the first rename no TLS handshake is needed, and both
+    requests are sent at the same time with a strict deadline. A slow or dead API
+    therefore costs at most the timeout, never a hung rename worker.
+
+    Only the standard library is used (http.client), and the base URL is a parameter,
+    so the client can be pointed at a local stand-in server.
+"""
+import collections
+import concurrent.futures
+import http.client
+import threading
+import time
+import urllib.parse
+
+BASE_URL = "https://decapi.me"
+TIMEOUT = 3.0
+MAX_IDLE = 4
+
+
+class HTTPPool:
+    """ Keep-alive connections to one host, shared between threads. """
+    def __init__(self, base_url: str, timeout: float=TIMEOUT, max_idle: int=MAX_IDLE):
+        """ Create an empty pool. Connections are opened on demand.
+
+        Args:
+            base_url (str): Scheme and host, e.g. "https://decapi.me".
+            timeout (float, optional): Socket timeout per request. Defaults to TIMEOUT.
+            max_idle (int, optional): Idle connections kept open. Defaults to MAX_IDLE.
+        """
+        url = urllib.parse.urlsplit(base_url)
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        """ Open a new connection. """
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn: http.client.HTTPConnection):
+        """ Return a connection to the pool, or close it if the pool is full. """
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def get(self, path: str) -> str:
+        """ GET a path and return the body as text.
+
+        A pooled connection the server has since closed is retried once on a fresh one.
+
+        Args:
+            path (str): Request path, starting with "/".
+
+        Returns:
+            str: The response body.
+
+        Raises:
+            OSError: On network errors and timeouts.
+            http.client.HTTPException: On protocol errors or a non-200 status.
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect()
+            try:
+                conn.request("GET", self.prefix + path, headers={"Connection": "keep-alive"})
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                    http.client.CannotSendRequest, http.client.BadStatusLine):
+                conn.close()
+                if not reused:
+                    raise
+                reused = False
+                conn = None
+                continue
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        if response.status != 200:
+            raise http.client.HTTPException(f"HTTP {response.status} for {path}")
+        charset = response.headers.get_content_charset() or "utf-8"
+        return body.decode(charset, "replace").strip()
+
+    def close(self):
+        """ Close every idle connection. """
+        with self._lock:
+            idle, self._idle = list(self._idle), collections.deque()
+        for conn in idle:
+            conn.close()
+
+
+class TwitchClient:
+    """ Stream title and game of a channel, fetched concurrently over pooled connections. """
+    def __init__(self, base_url: str=BASE_URL, timeout: float=TIMEOUT, debug: bool=False):
+        """ Create the client.
+
+        Args:
+            base_url (str, optional): The API host. Defaults to "https://decapi.me".
+            timeout (float, optional): Deadline for a lookup, in seconds. Defaults to TIMEOUT.
+            debug (bool, optional): Print lookup timings. Defaults to False.
+        """
+        self.timeout = timeout
+        self.debug = debug
+        self.pool = HTTPPool(base_url, timeout=timeout)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="OBSRenamerTwitch")
+
+    def fetch(self, channel: str) -> tuple:
+        """ Look up a channel's stream title and game at the same time.
+
+        Args:
+            channel (str): The Twitch channel.
+
+        Returns:
+            tuple: (str title, str game). Either is None if its request failed or missed
+                the deadline.
+        """
+        channel = urllib.parse.quote(str(channel), safe="")
+        started = time.monotonic()
+        futures = {
+            "title": self._executor.submit(self.pool.get, "/twitch/title/" + channel),
+            "game": self._executor.submit(self.pool.get, "/twitch/game/" + channel),
+        }
+        concurrent.futures.wait(futures.values(), timeout=self.timeout)
+        results = {}
+        for key, future in futures.items():
+            if not future.done():
+                print("ERROR: Twitch " + key + " lookup timed out.")
+                results[key] = None
+            elif future.exception() is not None:
+                print(f"ERROR: Twitch {key} lookup failed: {future.exception()}")
+                results[key] = None
+            else:
+                results[key] = future.result()
+        if self.debug:
+            print(f"DEBUG: Twitch lookup took {time.monotonic() - started:.3f}s")
+        return results["title"], results["game"]
+
+    def close(self):
+        """ Stop the request threads and close the pooled connections. """
+        self._executor.shutdown(wait=False)
+        self.pool.close()
@@ -0,0 +1,142 @@
+""" @file worker_priority.py
+    @author Sean Duffie
+    @brief Run background worker threads at low CPU and I/O priority.
+
+    On Linux, nice values, I/O priority and CPU affinity can all be set per thread by
+    passing the thread's native id. Worker threads call WorkerPriority.apply() when they
+    start, so deleting and moving multi-GB files never competes with the OBS encoder.
+    Everything here is best effort: on other platforms, or if the kernel refuses, the
+    thread simply keeps its normal priority.
+"""
+import ctypes
+import ctypes.util
+import os
+import platform
+import sys
+import threading
+
+IOPRIO_CLASS_NONE = 0
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+# Lowest best-effort level.
+IOPRIO_BE_LOWEST = 7
+
+_SYS_IOPRIO_SET = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "arm64": 30,
+    "riscv64": 30,
+    "ppc64le": 273,
+    "armv7l": 314,
+}
+
+
+def _load_libc():
+    """ Load libc for the raw ioprio_set syscall. None where it isn't available. """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+
+_LIBC = _load_libc()
+
+
+def parse_cpu_list(text: str) -> set:
+    """ Parse a CPU list in the kernel's format, e.g. "2-3,6".
+
+    Args:
+        text (str): The CPU list. Empty means no pinning.
+
+    Returns:
+        set: CPU numbers, or None if the text is empty or invalid.
+    """
+    cpus = set()
+    for part in (text or "").replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                low, high = part.split("-", 1)
+                cpus.update(range(int(low), int(high) + 1))
+            else:
+                cpus.add(int(part))
+        except ValueError:
+            print("ERROR: Invalid CPU list - " + str(text))
+            return None
+    return cpus or None
+
+
+def set_io_priority(tid: int, io_class: int, level: int=0) -> bool:
+    """ Set the I/O scheduling class of a thread.
+
+    Args:
+        tid (int): Native thread id. 0 means the calling thread.
+        io_class (int): One of the IOPRIO_CLASS_* constants.
+        level (int, optional): Priority within the class, 0 (high) to 7 (low).
+
+    Returns:
+        bool: True if the kernel accepted it.
+    """
+    number = _SYS_IOPRIO_SET.get(platform.machine())
+    if _LIBC is None or number is None:
+        return False
+    value = (io_class << IOPRIO_CLASS_SHIFT) | level
+    return _LIBC.syscall(number, IOPRIO_WHO_PROCESS, tid, value) == 0
+
+
+class WorkerPriority:
+    """ CPU nice, I/O class and affinity to apply to worker threads. """
+    def __init__(self, nice: int=10, io_class: int=IOPRIO_CLASS_IDLE, cpus: set=None,
+                 debug: bool=False):
+        """ Describe the priority for worker threads.
+
+        Args:
+            nice (int, optional): Nice value, 0 (normal) to 19 (lowest). Defaults to 10.
+            io_class (int, optional): IOPRIO_CLASS_IDLE, IOPRIO_CLASS_BE (lowest level),
+                or IOPRIO_CLASS_NONE to leave I/O alone. Defaults to IOPRIO_CLASS_IDLE.
+            cpus (set, optional): CPUs to pin the threads to. None leaves affinity alone.
+            debug (bool, optional): Print what was applied. Defaults to False.
+        """
+        self.nice = nice
+        self.io_class = io_class
+        self.cpus = cpus
+        self.debug = debug
+
+    def apply(self):
+        """ Lower the priority of the calling thread. Used as a thread initializer. """
+        if not sys.platform.startswith("linux"):
+            return
+        tid = threading.get_native_id()
+        applied = []
+        try:
+            # Unprivileged threads may only raise their nice value, never lower it.
+            current = os.getpriority(os.PRIO_PROCESS, tid)
+            if self.nice > current:
+                os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                applied.append("nice " + str(self.nice))
+        except OSError as e:
+            print(f"ERROR: Could not set worker nice value: {e}")
+
+        if self.io_class == IOPRIO_CLASS_IDLE:
+            if set_io_priority(tid, IOPRIO_CLASS_IDLE):
+                applied.append("ioprio idle")
+        elif self.io_class == IOPRIO_CLASS_BE:
+            if set_io_priority(tid, IOPRIO_CLASS_BE, IOPRIO_BE_LOWEST):
+                applied.append("ioprio best-effort 7")
+
+        if self.cpus:
+            try:
+                os.sched_setaffinity(tid, self.cpus)
+                applied.append("cpus " + ",".join(str(c) for c in sorted(self.cpus)))
+            except (OSError, ValueError) as e:
+                print(f"ERROR: Could not pin worker thread: {e}")
+
+        if self.debug:
+            print("DEBUG: " + threading.current_thread().name + " priority - "
+                  + (", ".join(applied) or "unchanged"))